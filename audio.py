@@ -0,0 +1,224 @@
+import threading
+import time
+import traceback
+
+import pygame
+
+# Mixer channels handed out by reserve_channels() so far.
+reserved_channels = 0
+
+def reserve_channels(count):
+  """Takes count mixer channels out of pygame's automatic allocation."""
+  global reserved_channels
+  first = reserved_channels
+  reserved_channels += count
+  if pygame.mixer.get_num_channels() < reserved_channels:
+    pygame.mixer.set_num_channels(reserved_channels)
+  pygame.mixer.set_reserved(reserved_channels)
+  return [pygame.mixer.Channel(i) for i in range(first, reserved_channels)]
+
+class AudioManager(object):
+  """Plays the music loops from memory instead of streaming them from disk.
+
+  Every track is decoded into a Sound on a background thread at startup, so
+  starting or switching music never touches the disk during a game. Tracks
+  play on two reserved channels, which lets a switch start the new loop on
+  one channel exactly as the old one stops (or fades out) on the other.
+
+  Loops are assumed to be beats_per_loop beats long, which gives the tempo
+  for switching on the beat.
+  """
+  def __init__(self, tracks, beats_per_loop=32):
+    self.tracks = tracks
+    self.beats_per_loop = beats_per_loop
+    self.sounds = {}
+    self.load_lock = threading.Lock()
+    # How long each track took to load, in ms.
+    self.load_times = {}
+    # Tracks that were still not loaded when the render thread needed them.
+    self.render_thread_loads = []
+    self.channels = None
+    self.current = 0
+    self.playing = None
+    self.started_at = None
+    self.switch_timer = None
+    self.lock = threading.Lock()
+
+  def preload(self):
+    """Loads every track on a background thread."""
+    thread = threading.Thread(
+      target=self.load_all, name='music-loader', daemon=True)
+    thread.start()
+    return thread
+
+  def load_all(self):
+    for name in self.tracks:
+      try:
+        self.load(name)
+      except Exception:
+        print(traceback.format_exc())
+    print('Loaded music: %s' % ', '.join(
+      '%s %s ms' % (name, ms) for name, ms in self.load_times.items()))
+
+  def load(self, name):
+    with self.load_lock:
+      if name not in self.sounds:
+        start = time.time()
+        self.sounds[name] = pygame.mixer.Sound(file=self.tracks[name])
+        self.load_times[name] = int((time.time() - start) * 1000)
+      return self.sounds[name]
+
+  def get(self, name):
+    sound = self.sounds.get(name)
+    if sound is None:
+      # Either the preloader hasn't got to it yet or it was never started;
+      # this blocks the caller, so keep track of it.
+      self.render_thread_loads.append(name)
+      print('Music %s was not preloaded' % name)
+      sound = self.load(name)
+    return sound
+
+  def get_channels(self):
+    if self.channels is None:
+      self.channels = reserve_channels(2)
+    return self.channels
+
+  def is_playing(self):
+    return any(channel.get_busy() for channel in self.get_channels())
+
+  def play(self, name, fade_ms=0):
+    """Starts looping name, replacing whatever is playing."""
+    with self.lock:
+      self.cancel_switch()
+      self.start(name, fade_ms)
+
+  def start(self, name, fade_ms):
+    sound = self.get(name)
+    channels = self.get_channels()
+    old = channels[self.current]
+    self.current = 1 - self.current
+    new = channels[self.current]
+    new.play(sound, loops=-1, fade_ms=fade_ms)
+    if fade_ms:
+      old.fadeout(fade_ms)
+    else:
+      old.stop()
+    self.playing = name
+    self.started_at = time.time()
+
+  def switch(self, name, fade_ms=0, on_beats=4):
+    """Switches to name on the next multiple of on_beats beats.
+
+    The new loop starts as the old one stops, or cross-fades with it over
+    fade_ms. With on_beats 0 the switch happens right away.
+    """
+    with self.lock:
+      self.cancel_switch()
+      if not self.playing or not on_beats:
+        self.start(name, fade_ms)
+        return
+      beat = self.get(self.playing).get_length() / self.beats_per_loop
+      period = beat * on_beats
+      position = time.time() - self.started_at
+      wait = period - position % period
+      self.switch_timer = threading.Timer(
+        wait, self.switch_now, (name, fade_ms))
+      self.switch_timer.daemon = True
+      self.switch_timer.start()
+
+  def switch_now(self, name, fade_ms):
+    with self.lock:
+      # Lost a race with cancel_switch().
+      if threading.current_thread() is not self.switch_timer:
+        return
+      self.switch_timer = None
+      self.start(name, fade_ms)
+
+  def cancel_switch(self):
+    if self.switch_timer:
+      self.switch_timer.cancel()
+      self.switch_timer = None
+
+  def stop(self, fade_ms=0):
+    with self.lock:
+      self.cancel_switch()
+      for channel in self.get_channels():
+        if fade_ms:
+          channel.fadeout(fade_ms)
+        else:
+          channel.stop()
+      self.playing = None
+
+class SoundEffects(object):
+  """Plays sound effects on pools of channels reserved per class of effect.
+
+  Each pool has a fixed number of voices and a rule for what happens when
+  all of them are busy: 'oldest' cuts off the voice that started first,
+  'drop' skips the new sound. Music and the other pools can never take a
+  voice away from an effect.
+
+  With a Resources registry each sound is only decoded when it first plays.
+  """
+  def __init__(self, pools, resources=None):
+    self.pools = {}
+    self.resources = resources
+    for name, (voices, steal) in pools.items():
+      self.pools[name] = EffectPool(voices, steal)
+
+  def load(self, filename, pool, priority=50):
+    load = lambda: pygame.mixer.Sound(file=filename)
+    if self.resources is None:
+      return Effect(load(), self.pools[pool])
+    key = 'sound %s' % filename
+    self.resources.register(key, load, priority)
+    return Effect(None, self.pools[pool],
+                  lambda: self.resources.get(key))
+
+  def stats(self):
+    return dict((name, pool.stats()) for name, pool in self.pools.items())
+
+class EffectPool(object):
+  def __init__(self, voices, steal):
+    self.voices = voices
+    self.steal = steal
+    self.channels = None
+    self.started = []
+    self.played = 0
+    self.stolen = 0
+    self.dropped = 0
+
+  def play(self, sound):
+    if self.channels is None:
+      self.channels = reserve_channels(self.voices)
+      self.started = [0] * self.voices
+    idx = None
+    for i, channel in enumerate(self.channels):
+      if not channel.get_busy():
+        idx = i
+        break
+    if idx is None:
+      if self.steal == 'drop':
+        self.dropped += 1
+        return None
+      idx = self.started.index(min(self.started))
+      self.stolen += 1
+    self.channels[idx].play(sound)
+    self.started[idx] = time.time()
+    self.played += 1
+    return self.channels[idx]
+
+  def stats(self):
+    return {'played': self.played, 'stolen': self.stolen,
+            'dropped': self.dropped}
+
+class Effect(object):
+  """A sound effect that plays through its pool."""
+  def __init__(self, sound, pool, load=None):
+    self.sound = sound
+    self.pool = pool
+    self.load = load
+
+  def play(self):
+    if self.sound is None:
+      self.sound = self.load()
+    return self.pool.play(self.sound)
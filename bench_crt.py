@@ -0,0 +1,55 @@
+# Compares the cost per frame of the old scanline mask blit with the CRT
+# filter, over the whole screen and over a typical set of dirty regions.
+#
+# Usage: python bench_crt.py [frames]
+
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+import crt
+from crt import CRTFilter
+
+width, height = 1024, 600
+
+def bench(name, frames, fn):
+  start = time.perf_counter()
+  for _ in range(frames):
+    fn()
+  ms = (time.perf_counter() - start) * 1000 / frames
+  print('%-36s %7.3f ms/frame' % (name, ms))
+
+frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+pygame.init()
+screen = pygame.display.set_mode((width, height))
+background = pygame.image.load('title/title00.jpg').convert()
+screen.blit(background, (0, 0))
+
+# The countdown digit and a blinking line of text, as on GetReadyDisplay.
+dirty = [pygame.Rect(0, 225, width, 175), pygame.Rect(0, 400, width, 200)]
+
+numpy = crt.numpy
+crt.numpy = None
+mask = CRTFilter((width, height)).mask
+crt.numpy = numpy
+
+print('NumPy: %s' % (numpy.__version__ if numpy else 'not installed'))
+bench('mask blit, full screen', frames,
+      lambda: screen.blit(mask, (0, 0)))
+bench('mask blit, dirty regions', frames,
+      lambda: [screen.blit(mask, r, r) for r in dirty])
+if numpy:
+  scanlines = CRTFilter((width, height))
+  bench('filter, full screen', frames, lambda: scanlines.apply(screen))
+  bench('filter, dirty regions', frames,
+        lambda: scanlines.apply(screen, dirty))
+  dimmed = CRTFilter((width, height), scanline_level=0.5, dim=0.9)
+  bench('filter + dim, full screen', frames, lambda: dimmed.apply(screen))
+  bloom = CRTFilter((width, height), bloom=0.3, cache_frames=1)
+  bench('filter + bloom, full screen', frames, lambda: bloom.apply(screen))
+  bench('filter + bloom, cached frame', frames,
+        lambda: bloom.apply(screen, key='title'))
@@ -0,0 +1,172 @@
+# Renders every display of the game headless and reports what a frame of
+# each one costs, so rendering changes can be measured without the cabinet.
+#
+# Frames go through the same update/draw/CRT/flip path as the game, with
+# SDL's dummy video and audio drivers, as fast as they can be drawn. Every
+# frame moves the displays on by 33 ms, as at 30 fps. When a display moves
+# on to the next one by itself it is set up again, which is timed apart.
+# The high scores are run off a copy of scores.sample.json and off synthetic
+# score files of 1k, 10k and 100k rows.
+#
+# Usage: python bench_displays.py [--frames 300] [--only MainDisplay ...]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import game
+from scores import ScoreStore
+
+FRAME_MS = 33
+
+parser = argparse.ArgumentParser(
+  description='Benchmark every display of the game headless.')
+parser.add_argument('--frames', type=int, default=300,
+                    help='frames to draw of each display')
+parser.add_argument('--only', nargs='+', metavar='NAME',
+                    help='only run the benchmarks whose names start with '
+                         'one of these')
+parser.add_argument('--rows', type=int, nargs='*',
+                    default=[1000, 10000, 100000],
+                    help='sizes of the synthetic high score files')
+parser.add_argument('--json', metavar='PATH',
+                    help='also write the results to PATH as JSON')
+args = parser.parse_args()
+
+def synthetic_scores(path, rows):
+  scores = []
+  for _ in range(rows):
+    name = ''.join(random.choice(string.ascii_uppercase) for _ in range(3))
+    scores.append([name, random.randint(0, 2000)])
+  scores.sort(key=lambda entry: -entry[1])
+  with open(path, 'w') as f:
+    json.dump(scores, f)
+
+def two_players():
+  game.game.scores = [[310, 'AAA'], [250, 'BBB']]
+  game.game.total_players = 2
+  game.game.score = 250
+  game.game.drink_for = 'AAA'
+
+def one_player():
+  game.game.scores = [[310]]
+  game.game.total_players = 1
+  game.game.score = 310
+  game.game.drink_for = 'AAA'
+
+def waiting_player():
+  one_player()
+  game.game.set_drink_to_pour(0)
+
+def press_scoring_keys(frame):
+  # A hit every half a second or so, as in a quick game.
+  if frame % 15 == 0:
+    game.game.handle_key(random.choice(list(game.scorekey_to_string)))
+
+BENCHMARKS = [
+  ('TitleDisplay', game.TitleDisplay, None, None),
+  ('GameOverDisplay', game.GameOverDisplay, None, None),
+  ('PlayerSelectDisplay', game.PlayerSelectDisplay, None, None),
+  ('GetReadyDisplay', lambda g: game.GetReadyDisplay(g, display_player=2),
+   one_player, None),
+  ('MainDisplay', game.MainDisplay, one_player, press_scoring_keys),
+  ('DrinkDisplay', lambda g: game.DrinkDisplay(g, display_player=1),
+   one_player, None),
+  ('EnterScoreDisplay', lambda g: game.EnterScoreDisplay(g, display_player=1),
+   one_player, None),
+  ('WinnerDisplay', game.WinnerDisplay, two_players, None),
+  ('PleaseWaitDisplay', game.PleaseWaitDisplay, waiting_player, None),
+  ('OutOfOrderDisplay', game.OutOfOrderDisplay, None, None),
+]
+
+def run(name, make_display, setup=None, each_frame=None):
+  if setup:
+    setup()
+  profiler = game.profiler
+  profiler.times = {}
+  setups = []
+  drawn_state = None
+  display = None
+  for frame in range(args.frames):
+    if game.game.current_state is not display:
+      start = time.perf_counter()
+      display = game.game.current_state = make_display(game.game)
+      setups.append((time.perf_counter() - start) * 1000)
+    if each_frame:
+      each_frame(frame)
+    profiler.start_frame()
+    drawn_state = game.render_frame(drawn_state)
+    profiler.end_frame()
+  summary = profiler.summary()
+  cls = type(display).__name__
+  result = {
+    'name': name,
+    'frames': args.frames,
+    'frame': summary['frame'],
+    'update': summary['update:%s' % cls],
+    # A display that hands over in update() never gets to draw.
+    'draw': summary.get('draw:%s' % cls),
+    'crt': summary['crt'],
+    'flip': summary['flip'],
+    'setups': len(setups),
+    'setup_ms': round(max(setups), 2),
+  }
+  frame = result['frame']
+  draw = result['draw']['p50'] if result['draw'] else float('nan')
+  print('%-26s %7.1f fps %7.2f %7.2f %7.2f ms %7.2f %7.2f ms %5s %9.2f ms' % (
+    name, 1000 / max(frame['p50'], 0.001), frame['p50'], frame['p95'],
+    frame['max'], result['update']['p50'], draw, len(setups),
+    result['setup_ms']))
+  return result
+
+def wanted(name):
+  return not args.only or any(name.startswith(prefix) for prefix in args.only)
+
+# Measure the displays with all of their frames, not while they load.
+while not all(frames.is_done() for frames in game.animations.values()):
+  time.sleep(0.05)
+# Run unthrottled, with the displays' clocks moving on at the usual rate.
+game.game.max_fps = 0
+game.game.fixed_tick = FRAME_MS
+game.profiler.dump_path = None
+game.profiler.window = args.frames
+random.seed(0)
+
+print('%-26s %11s %7s %7s %10s %7s %7s %5s %12s' % (
+  'display', '', 'p50', 'p95', 'max', 'update', 'draw', 'setup',
+  'setup max'))
+results = []
+for name, make_display, setup, each_frame in BENCHMARKS:
+  if wanted(name):
+    results.append(run(name, make_display, setup, each_frame))
+
+tmp_dir = tempfile.mkdtemp()
+try:
+  score_files = [('HighScoresDisplay', 'scores.sample.json')]
+  for rows in args.rows:
+    score_files.append(('HighScoresDisplay %sk' % (rows // 1000), rows))
+  for name, source in score_files:
+    if not wanted(name):
+      continue
+    path = os.path.join(tmp_dir, 'scores-%s.json' % len(results))
+    if isinstance(source, int):
+      synthetic_scores(path, source)
+    else:
+      shutil.copy(source, path)
+    game.score_store = ScoreStore(path, writer=game.score_writer)
+    results.append(run(name, game.HighScoresDisplay, two_players))
+finally:
+  game.score_writer.flush()
+  shutil.rmtree(tmp_dir)
+
+if args.json:
+  with open(args.json, 'w') as f:
+    json.dump(results, f, indent=2)
@@ -0,0 +1,47 @@
+# Compares the cost per frame of presenting the 1024x600 screen on the
+# panel sizes the cabinet is likely to meet, for each way of scaling it:
+# a whole new frame, a static frame that was scaled before, and the dirty
+# regions of a typical display.
+#
+# SDL's scaling happens on the GPU and can't be measured here, so this
+# covers the software path, which is what runs where SDL has no renderer.
+#
+# Usage: python bench_scaling.py [frames]
+
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from scaling import ScaledScreen
+
+size = 1024, 600
+panels = [(800, 480), (1024, 600), (1280, 720), (1280, 800), (1366, 768),
+          (1920, 1080), (2048, 1200)]
+
+def bench(name, frames, fn):
+  start = time.perf_counter()
+  for _ in range(frames):
+    fn()
+  ms = (time.perf_counter() - start) * 1000 / frames
+  print('%-40s %7.3f ms/frame' % (name, ms))
+
+frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+pygame.init()
+# The countdown digit and a blinking line of text, as on GetReadyDisplay.
+dirty = [pygame.Rect(0, 225, 1024, 175), pygame.Rect(0, 400, 1024, 200)]
+
+for panel in panels:
+  for smooth in (False, True):
+    scaled = ScaledScreen(size, mode='software', smooth=smooth,
+                          cache_frames=1, window_size=panel)
+    background = pygame.image.load('title/title00.jpg').convert()
+    scaled.surface.blit(background, (0, 0))
+    name = '%sx%s %s -> %sx%s' % (panel + (
+      'smooth' if smooth else 'sharp',) + scaled.target.size)
+    bench(name + ', full', frames, lambda: scaled.present())
+    bench(name + ', static', frames, lambda: scaled.present(key='title'))
+    bench(name + ', dirty', frames, lambda: scaled.present(dirty))
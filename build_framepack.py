@@ -0,0 +1,59 @@
+# Converts the title and spinner animations into a single pack of raw pixels
+# in the display's pixel format, so the game can map the frames at startup
+# instead of decoding 100 JPGs. Run this on the cabinet itself, and again
+# whenever the images change (the game falls back to the JPGs until then).
+
+import json
+import os
+import struct
+
+import pygame
+
+from frames import *
+
+pygame.init()
+screen = pygame.display.set_mode((1, 1), pygame.HIDDEN)
+masks = tuple(screen.get_masks()[:3])
+if screen.get_bitsize() != 32 or masks not in MASKS_TO_FORMAT:
+  raise SystemExit('Unsupported display format: %s bit, masks %s' % (
+    screen.get_bitsize(), masks))
+fmt = MASKS_TO_FORMAT[masks]
+
+size = None
+animations = {}
+frames = []
+offset = 0
+for name, (pattern, count) in ANIMATIONS.items():
+  sources = []
+  for i in range(count):
+    filename = pattern % i
+    s = pygame.image.load(filename).convert()
+    if size is None:
+      size = s.get_size()
+    elif s.get_size() != size:
+      raise SystemExit('%s is %sx%s, expected %sx%s' % (
+        (filename,) + s.get_size() + size))
+    frames.append(pygame.image.tobytes(s, fmt))
+    sources.append([filename] + list(source_stat(filename)))
+  animations[name] = {'offset': offset, 'count': count, 'sources': sources}
+  offset += count * size[0] * size[1] * 4
+  print('Packed %s frames of %s' % (count, pattern))
+
+header = json.dumps({
+  'version': PACK_VERSION,
+  'size': size,
+  'bitsize': 32,
+  'masks': masks,
+  'format': fmt,
+  'animations': animations,
+}).encode('utf-8')
+
+tmp_filename = PACK_FILENAME + '.tmp'
+with open(tmp_filename, 'wb') as f:
+  f.write(PACK_MAGIC + struct.pack('<I', len(header)) + header)
+  f.write(b'\0' * (pack_data_offset(len(header)) - f.tell()))
+  for frame in frames:
+    f.write(frame)
+os.replace(tmp_filename, PACK_FILENAME)
+print('Wrote %s (%s MB)' % (
+  PACK_FILENAME, os.path.getsize(PACK_FILENAME) // (1024 * 1024)))
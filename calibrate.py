@@ -0,0 +1,62 @@
+# Measures the flow rate of every line so drinks pour for exactly as long as
+# their recipe in rewardmap.json needs. Prime the lines first (prime.py),
+# then hold a measuring jug under each line in turn when asked.
+#
+# Usage: python calibrate.py [--secs 10] [--pins 0 5 ...]
+
+import argparse
+import json
+import os
+import time
+
+from gpiozero import LED
+
+from values import CALIBRATION_PATH, TIER_TO_PINS
+
+parser = argparse.ArgumentParser(
+  description='Measure the flow rate of each line in ml/s.')
+parser.add_argument('--secs', type=float, default=10,
+                    help='how long to run each line for')
+parser.add_argument('--pins', type=int, nargs='+',
+                    help='only calibrate these pins (default: all of them)')
+parser.add_argument('--prime-ml', type=float,
+                    help='also record that these lines take this many ml to '
+                         'fill, for prime.py')
+args = parser.parse_args()
+
+calibration = {}
+if os.path.isfile(CALIBRATION_PATH):
+  with open(CALIBRATION_PATH) as f:
+    calibration = json.load(f)
+calibration.setdefault('ml_per_sec', {})
+calibration.setdefault('prime_ml', {})
+
+for tier, pins in sorted(TIER_TO_PINS.items()):
+  for pin in pins:
+    if args.pins and pin not in args.pins:
+      continue
+    switch = LED(pin)
+    input('Tier %s, pin %s: put a jug under the line and press Enter ' % (
+      tier, pin))
+    switch.on()
+    time.sleep(args.secs)
+    switch.off()
+    ml = float(input('How many ml came out? '))
+    calibration['ml_per_sec'][str(pin)] = round(ml / args.secs, 3)
+    print('Pin %s pours %.2f ml/s' % (pin, ml / args.secs))
+    if args.prime_ml:
+      calibration['prime_ml'][str(pin)] = args.prime_ml
+    switch.close()
+
+calibration['measured_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+tmp_path = CALIBRATION_PATH + '.tmp'
+with open(tmp_path, 'w') as f:
+  json.dump(calibration, f, indent=2, sort_keys=True)
+os.replace(tmp_path, CALIBRATION_PATH)
+print('Wrote %s' % CALIBRATION_PATH)
+
+# Imported late so calibrating doesn't need a display.
+from robot import BaseRobot
+robot = BaseRobot(calibration=calibration['ml_per_sec'])
+for tier, drink in robot.tier_to_drink.items():
+  print('%s now pours in %.1f s' % (drink, robot.pour_time_ms(tier) / 1000))
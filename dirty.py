@@ -0,0 +1,38 @@
+import pygame
+
+class DirtyRegions(object):
+  """Remembers what was drawn in each region of a display.
+
+  Displays call track() for every region with a signature of whatever
+  decides its contents, and only draw the region when it returns True. A
+  region is reported as dirty only when its signature differs from the one
+  it had on the previous frame, or it was invalidated since. A dirty region
+  must be painted over completely.
+  """
+  def __init__(self):
+    self.signatures = {}
+    self.rects = []
+
+  def track(self, rect, *signature):
+    rect = pygame.Rect(rect)
+    key = tuple(rect)
+    if key not in self.signatures or self.signatures[key] != signature:
+      self.signatures[key] = signature
+      self.rects.append(rect)
+      return True
+    return False
+
+  def invalidate(self, rect=None):
+    """Makes the regions touching rect, or all of them, dirty next time."""
+    for key in list(self.signatures):
+      if rect is None or pygame.Rect(key).colliderect(rect):
+        del self.signatures[key]
+
+  def touches(self, rect):
+    """Whether any region dirty on this frame overlaps rect."""
+    return pygame.Rect(rect).collidelist(self.rects) != -1
+
+  def pop(self):
+    rects = self.rects
+    self.rects = []
+    return rects
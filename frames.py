@@ -0,0 +1,215 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import traceback
+
+import pygame
+
+# Animations shipped with the game, as (filename pattern, frame count).
+ANIMATIONS = {
+  'title': ('title/title%02d.jpg', 50),
+  'spinner': ('spinner/spinner%02d.jpg', 50),
+}
+
+PACK_FILENAME = 'frames.pack'
+PACK_MAGIC = b'WBFP'
+PACK_VERSION = 1
+# Frame data starts on a page boundary so each frame can be mapped as is.
+PACK_ALIGN = 4096
+
+# Raw byte orders pygame can wrap without a copy, keyed by the RGB masks of
+# the 32 bit surface they describe (on a little-endian machine).
+MASKS_TO_FORMAT = {
+  (0xff0000, 0xff00, 0xff): 'BGRA',
+  (0xff, 0xff00, 0xff0000): 'RGBX',
+}
+
+class FrameLoader(object):
+  """Decodes the frames of an animation on a worker thread.
+
+  Frames are decoded in playback order, so a display can start animating as
+  soon as the first frame is in and simply hold on the newest decoded frame
+  until the next one catches up.
+  """
+  def __init__(self, pattern, count):
+    self.pattern = pattern
+    self.count = count
+    self.surfaces = [None] * count
+    self.loaded = 0
+    self.first_frame_ms = None
+    self.load_time_ms = None
+
+  def __len__(self):
+    return self.count
+
+  def get(self, idx):
+    return self.surfaces[idx]
+
+  def next_index(self, idx):
+    nxt = idx + 1
+    if nxt == self.count:
+      nxt = 0
+    if self.surfaces[nxt] is None:
+      return idx
+    return nxt
+
+  def is_done(self):
+    return self.loaded == self.count
+
+  def load(self):
+    start = time.time()
+    for i in range(self.count):
+      # The game is shutting down, so nothing will ever show the rest.
+      if pygame.display.get_surface() is None:
+        return
+      s = pygame.image.load(self.pattern % i)
+      self.surfaces[i] = s.convert()
+      self.loaded = i + 1
+      if i == 0:
+        self.first_frame_ms = int((time.time() - start) * 1000)
+    self.load_time_ms = int((time.time() - start) * 1000)
+    print('Loaded %s frames of %s in %s ms (first frame after %s ms)' % (
+      self.count, self.pattern, self.load_time_ms, self.first_frame_ms))
+
+class PackedFrames(object):
+  """The frames of one animation, wrapped straight out of a mapped pack."""
+  def __init__(self, pack, offset, count):
+    self.pack = pack
+    self.offset = offset
+    self.count = count
+    self.surfaces = [None] * count
+
+  def __len__(self):
+    return self.count
+
+  def get(self, idx):
+    if self.surfaces[idx] is None:
+      self.surfaces[idx] = self.pack.wrap(
+        self.offset + idx * self.pack.frame_bytes)
+    return self.surfaces[idx]
+
+  def next_index(self, idx):
+    idx += 1
+    if idx == self.count:
+      idx = 0
+    return idx
+
+  def is_done(self):
+    return True
+
+class FramePack(object):
+  """A memory-mapped pack of raw frames written by build_framepack.py."""
+  def __init__(self, path, header, data_offset):
+    self.path = path
+    self.header = header
+    self.size = tuple(header['size'])
+    self.format = header['format']
+    self.frame_bytes = self.size[0] * self.size[1] * 4
+    self.fd = open(path, 'rb')
+    # ACCESS_COPY keeps the mapping private, so a stray write to one of the
+    # wrapped surfaces can never reach the file.
+    self.map = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_COPY)
+    self.view = memoryview(self.map)
+    self.data_offset = data_offset
+
+  @classmethod
+  def open(cls, path, surface):
+    """Returns the pack at path, or None if it is missing or stale.
+
+    A pack is stale when it was built for a different pixel format than
+    surface or when any of its source images changed since it was built.
+    """
+    if not os.path.isfile(path):
+      return None
+    with open(path, 'rb') as f:
+      prefix = f.read(8)
+      if len(prefix) < 8:
+        print('Ignoring %s: truncated' % path)
+        return None
+      magic, header_len = struct.unpack('<4sI', prefix)
+      if magic != PACK_MAGIC:
+        print('Ignoring %s: not a frame pack' % path)
+        return None
+      header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('version') != PACK_VERSION:
+      print('Ignoring %s: built by an older version' % path)
+      return None
+    if (header['bitsize'] != surface.get_bitsize() or
+        tuple(header['masks']) != tuple(surface.get_masks()[:3])):
+      print('Ignoring %s: built for a different pixel format' % path)
+      return None
+    for animation in header['animations'].values():
+      for filename, size, mtime in animation['sources']:
+        if not source_matches(filename, size, mtime):
+          print('Ignoring %s: %s changed since it was built' % (
+            path, filename))
+          return None
+    return cls(path, header, pack_data_offset(header_len))
+
+  def frames(self, name):
+    animation = self.header['animations'].get(name)
+    if animation is None:
+      return None
+    return PackedFrames(
+      self, self.data_offset + animation['offset'], animation['count'])
+
+  def wrap(self, offset):
+    buf = self.view[offset:offset + self.frame_bytes]
+    s = pygame.image.frombuffer(buf, self.size, self.format)
+    # The padding byte is not alpha, so blit it as an opaque surface.
+    s.set_alpha(None)
+    return s
+
+def source_stat(filename):
+  st = os.stat(filename)
+  return st.st_size, st.st_mtime_ns
+
+def source_matches(filename, size, mtime):
+  try:
+    return source_stat(filename) == (size, mtime)
+  except OSError:
+    return False
+
+def pack_data_offset(header_len):
+  offset = 8 + header_len
+  return (offset + PACK_ALIGN - 1) // PACK_ALIGN * PACK_ALIGN
+
+def load_animations(surface, pack_path=PACK_FILENAME):
+  """Returns the frames of every animation, keyed by name.
+
+  Animations come from the frame pack when it is up to date for surface,
+  otherwise their JPGs are decoded on a background thread.
+  """
+  pack = FramePack.open(pack_path, surface)
+  animations = {}
+  loaders = []
+  for name, (pattern, count) in ANIMATIONS.items():
+    frames = pack.frames(name) if pack else None
+    if frames is None or len(frames) != count:
+      frames = FrameLoader(pattern, count)
+      loaders.append(frames)
+    animations[name] = frames
+  if pack:
+    print('Mapped frames from %s' % pack_path)
+  if loaders:
+    start_loading(*loaders)
+  return animations
+
+def start_loading(*loaders):
+  """Loads each of the loaders in turn on a single background thread."""
+  def run():
+    for loader in loaders:
+      try:
+        loader.load()
+      except Exception:
+        # The display went away mid-frame as the game exited.
+        if pygame.display.get_surface() is None:
+          return
+        print(traceback.format_exc())
+
+  thread = threading.Thread(target=run, name='frame-loader', daemon=True)
+  thread.start()
+  return thread
@@ -7,18 +7,43 @@
 # ,    Move left in menus
 # .    Move right in menus
 # ESC  Quit at any time
-
-import json
-import os
+#
+# python game.py --record FILE saves the session's input to FILE, and
+# python game.py --replay FILE plays it back as fast as it can be drawn.
+# python game.py --profile-startup prints what every import and asset took
+# to load, once the first frame is up and again once the rest are in.
+
+import argparse
+import atexit
+import bisect
+import math
 import sys
+import time
 import traceback
 
+startup_time = time.time()
+
+# Fonts and sounds load when they are first used, or in idle time once the
+# first frame is up; see resources.py.
+from resources import resources
+resources.watch_imports()
+
 import pygame
 
-pygame.mixer.pre_init(44100, -16, 2, 1024)
-pygame.init()
-screen = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
+from values import *
+
+pygame.mixer.pre_init(44100, -16, 2, MIXER_BUFFER)
+resources.timed('pygame.init', pygame.init)
+# Everything is laid out for a 1024x600 screen, scaled to fit the panel.
+from scaling import ScaledScreen
+scaled_screen = resources.load('screen', lambda: ScaledScreen(
+  (1024, 600), mode=SCREEN_SCALING, smooth=SCREEN_SCALE_SMOOTH,
+  cache_frames=SCREEN_CACHE_FRAMES))
+screen = scaled_screen.surface
 pygame.mouse.set_visible(False)
+if USE_DIRTY_RECTS and not scaled_screen.partial_updates:
+  print('USE_DIRTY_RECTS does nothing when SDL does the scaling, drawing '
+        'whole frames')
 
 scorekey_to_string = {
   pygame.K_1: '1',
@@ -29,16 +54,31 @@ scorekey_to_string = {
   pygame.K_6: '6',
 }
 
-from values import *
-from robot import robot
+from robot import BaseRobot, robot
+from audio import AudioManager, SoundEffects
+from frames import load_animations
+from textcache import CachedFont, text_cache
+from surfpool import surface_pool
+from dirty import DirtyRegions
+from crt import CRTFilter
+from scores import (VIEW_TITLES, BackgroundWriter, ScoreStore,
+                    SqliteScoreStore)
+from perf import FrameProfiler
+from replay import Recorder, Replayer
 
 ARCADE_FONT_NAME = 'Gameplay.ttf'
 MONO_FONT_NAME = 'DejaVuSansMono.ttf'
 
-width, height = 1024, 600
+width, height = screen.get_size()
 half = width, height//2
 quarter = width, height//4
 three_quarters = width, height//4 * 3
+rect_full = pygame.Rect(0, 0, width, height)
+rect_top_half = pygame.Rect(0, 0, width, height//2)
+rect_bottom_half = pygame.Rect(0, height//2, width, height//2)
+rect_top_quarter = pygame.Rect(0, 0, width, height//4)
+rect_bottom_three_quarters = pygame.Rect(0, height//4, width, height*3//4)
+rect_ticker = pygame.Rect(0, height - 36, width, 36)
 clr_grey = pygame.Color('#DDDDDD')
 clr_black = pygame.Color('#000000')
 clr_white = pygame.Color('#FFFFFF')
@@ -46,35 +86,67 @@ clr_neon_blue = pygame.Color('#BBFFFF')
 clr_neon_pink = pygame.Color('#FF69B4')
 clr_neon_green = pygame.Color('#9AFF87')
 clr_neon_yellow = pygame.Color('#F3F360')
-fnt_arcade_50 = pygame.font.Font(ARCADE_FONT_NAME, 50)
-fnt_arcade_80 = pygame.font.Font(ARCADE_FONT_NAME, 80)
-fnt_arcade_150 = pygame.font.Font(ARCADE_FONT_NAME, 150)
-fnt_arcade_100 = pygame.font.Font(ARCADE_FONT_NAME, 100)
-fnt_arcade_140 = pygame.font.Font(ARCADE_FONT_NAME, 140)
-fnt_arcade_260 = pygame.font.Font(ARCADE_FONT_NAME, 260)
-fnt_mono_200 = pygame.font.Font(MONO_FONT_NAME, 200)
-fnt_mono_120 = pygame.font.Font(MONO_FONT_NAME, 120)
-fnt_mono_100 = pygame.font.Font(MONO_FONT_NAME, 100)
+# In order of priority: the attract loop, choosing players, then the game.
+fnt_arcade_50 = CachedFont(ARCADE_FONT_NAME, 50, text_cache,
+                           resources=resources, priority=10)
+fnt_arcade_80 = CachedFont(ARCADE_FONT_NAME, 80, text_cache,
+                           resources=resources, priority=20)
+fnt_arcade_150 = CachedFont(ARCADE_FONT_NAME, 150, text_cache,
+                            resources=resources, priority=50)
+fnt_arcade_100 = CachedFont(ARCADE_FONT_NAME, 100, text_cache,
+                            resources=resources, priority=20)
+fnt_arcade_140 = CachedFont(ARCADE_FONT_NAME, 140, text_cache,
+                            resources=resources, priority=30)
+fnt_arcade_260 = CachedFont(ARCADE_FONT_NAME, 260, text_cache,
+                            resources=resources, priority=10)
+fnt_mono_200 = CachedFont(MONO_FONT_NAME, 200, text_cache,
+                          resources=resources, priority=30)
+fnt_mono_120 = CachedFont(MONO_FONT_NAME, 120, text_cache,
+                          resources=resources, priority=10)
+fnt_mono_100 = CachedFont(MONO_FONT_NAME, 100, text_cache,
+                          resources=resources, priority=10)
+fnt_mono_24 = CachedFont(MONO_FONT_NAME, 24, text_cache,
+                         resources=resources, priority=30)
 NAME_OFFSET_Y = 40
 
-snd_target_hit = pygame.mixer.Sound(file='sound_fx/trolley-bell-1.wav')
-snd_start_game = pygame.mixer.Sound(file='sound_fx/click-sweeper-bright-1.wav')
-snd_forward = pygame.mixer.Sound(file='sound_fx/click-synth-shimmer.wav')
-snd_accepted = pygame.mixer.Sound(file='sound_fx/click-synth-flutter.wav')
-snd_backward = pygame.mixer.Sound(file='sound_fx/click-soft-digital.wav')
-snd_denied = pygame.mixer.Sound(file='sound_fx/click-double-digital.wav')
-
-title_surfaces = []
-for i in range(50):
-  filename = 'title/title%02d.jpg' % i
-  s = pygame.image.load(filename)
-  title_surfaces.append(s.convert())
-
-spinner_surfaces = []
-for i in range(50):
-  filename = 'spinner/spinner%02d.jpg' % i
-  s = pygame.image.load(filename)
-  spinner_surfaces.append(s.convert())
+# Quick runs of hits ring over each other, cutting off the oldest bell only
+# when all four are going. Menu clicks get their own two voices.
+sfx = SoundEffects({
+  'hit': (4, 'oldest'),
+  'menu': (2, 'oldest'),
+}, resources=resources)
+snd_target_hit = sfx.load('sound_fx/trolley-bell-1.wav', 'hit', 30)
+snd_start_game = sfx.load('sound_fx/click-sweeper-bright-1.wav', 'menu', 20)
+snd_forward = sfx.load('sound_fx/click-synth-shimmer.wav', 'menu', 20)
+snd_accepted = sfx.load('sound_fx/click-synth-flutter.wav', 'menu', 20)
+snd_backward = sfx.load('sound_fx/click-soft-digital.wav', 'menu', 20)
+snd_denied = sfx.load('sound_fx/click-double-digital.wav', 'menu', 20)
+
+# In the order they are needed: the attract loop starts with the bass line.
+music = AudioManager({
+  'bass': 'sound_fx/bass-z.wav',
+  'game': 'game_loop.wav',
+  'hurry': 'game_loop_hurry.wav',
+}, beats_per_loop=MUSIC_BEATS_PER_LOOP)
+if USE_MUSIC:
+  music.preload()
+
+animations = resources.load('animations', lambda: load_animations(screen))
+title_frames = animations['title']
+spinner_frames = animations['spinner']
+
+# Scores are written to disk in the background; make sure they all land
+# before the game exits.
+score_writer = BackgroundWriter()
+atexit.register(score_writer.flush)
+if SCORE_BACKEND == 'sqlite':
+  score_store = SqliteScoreStore('scores.db', writer=score_writer)
+else:
+  score_store = ScoreStore('scores.json', writer=score_writer)
+
+profiler = FrameProfiler(window=PERF_WINDOW_FRAMES, dump_path=PERF_DUMP_PATH,
+                         dump_secs=PERF_DUMP_SECS, writer=score_writer)
+profiler.counters['surfaces'] = surface_pool.stats
 
 class TitleDisplay(object):
   def __init__(self, game):
@@ -82,9 +154,25 @@ class TitleDisplay(object):
     self.elapsed = 0
     self.total_time = 0
     self.idx = 0
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    screen.blit(title_surfaces[self.idx], (0, 0))
+    frame = title_frames.get(self.idx)
+    if self.dirty.track(rect_full, self.idx, frame is not None):
+      if frame:
+        screen.blit(frame, (0, 0))
+      else:
+        screen.fill(clr_grey)
+
+  def dirty_rects(self):
+    return self.dirty.pop()
+
+  def static_key(self):
+    if title_frames.get(self.idx):
+      return ('title', self.idx)
+
+  def next_change_ms(self):
+    return min(30 - self.elapsed, 8000 - self.total_time)
 
   def update(self, tick):
     self.elapsed += tick
@@ -92,11 +180,9 @@ class TitleDisplay(object):
     if self.total_time > 8000:
       self.game.goto_high_scores()
       return
-    if self.elapsed > 30:
-      self.elapsed = 0
-      self.idx += 1
-      if self.idx == len(title_surfaces):
-        self.idx = 0
+    if self.elapsed >= 30:
+      self.elapsed -= 30
+      self.idx = title_frames.next_index(self.idx)
 
   def handle_key(self, keycode):
     if keycode == pygame.K_SPACE:
@@ -105,8 +191,8 @@ class TitleDisplay(object):
 class GameOverDisplay(object):
   def __init__(self, game):
     self.game = game
-    self.top = pygame.Surface(half)
-    self.bottom = pygame.Surface(half)
+    self.top = surface_pool.borrow(self, half)
+    self.bottom = surface_pool.borrow(self, half)
     self.txt_game = fnt_arcade_260.render('GAME', 1, clr_neon_pink)
     self.txt_over = fnt_arcade_260.render('OVER', 1, clr_neon_pink)
     self.elapsed = 0
@@ -115,21 +201,29 @@ class GameOverDisplay(object):
     self.colors = [clr_neon_blue, clr_neon_green, clr_neon_pink]
     self.top_idx = 0
     self.bottom_idx = 1
-    if USE_MUSIC and not pygame.mixer.music.get_busy():
-      pygame.mixer.music.load('sound_fx/bass-z.wav')
-      pygame.mixer.music.play(-1)
+    self.dirty = DirtyRegions()
+    if USE_MUSIC and not music.is_playing():
+      music.play('bass')
 
   def draw(self):
-    self.top.fill(self.colors[self.top_idx])
-    self.bottom.fill(self.colors[self.bottom_idx])
-    game_x = (width - self.txt_game.get_width()) // 2
-    game_y = (height//2 - self.txt_game.get_height()) // 2
-    self.top.blit(self.txt_game, (game_x, game_y))
-    over_x = (width - self.txt_over.get_width()) // 2
-    over_y = (height//2 - self.txt_over.get_height()) // 2
-    self.bottom.blit(self.txt_over, (over_x, over_y))
-    screen.blit(self.top, (0, 0))
-    screen.blit(self.bottom, (0, height//2))
+    if self.dirty.track(rect_top_half, self.top_idx):
+      self.top.fill(self.colors[self.top_idx])
+      game_x = (width - self.txt_game.get_width()) // 2
+      game_y = (height//2 - self.txt_game.get_height()) // 2
+      self.top.blit(self.txt_game, (game_x, game_y))
+      screen.blit(self.top, (0, 0))
+    if self.dirty.track(rect_bottom_half, self.bottom_idx):
+      self.bottom.fill(self.colors[self.bottom_idx])
+      over_x = (width - self.txt_over.get_width()) // 2
+      over_y = (height//2 - self.txt_over.get_height()) // 2
+      self.bottom.blit(self.txt_over, (over_x, over_y))
+      screen.blit(self.bottom, (0, height//2))
+
+  def dirty_rects(self):
+    return self.dirty.pop()
+
+  def next_change_ms(self):
+    return min(150 - self.elapsed, 6000 - self.total_time)
 
   def update(self, tick):
     self.total_time += tick
@@ -137,8 +231,8 @@ class GameOverDisplay(object):
       self.game.goto_title()
       return
     self.elapsed += tick
-    if self.elapsed > 150:
-      self.elapsed = 0
+    if self.elapsed >= 150:
+      self.elapsed -= 150
       self.top_idx += 1
       self.bottom_idx += 1
       if self.top_idx > len(self.colors) - 1:
@@ -160,14 +254,13 @@ class ScoreAnimation(object):
     self.showing = True
 
   def draw(self):
+    self.surface.fill(self.fill_color)
     if self.showing:
       score_str = str(self.score)
       txt_scored = fnt_arcade_260.render(score_str, 1, clr_neon_green)
       score_x = (width - txt_scored.get_width()) // 2
       score_y = (height // 2 - txt_scored.get_height()) // 2
       self.surface.blit(txt_scored, (score_x, score_y))
-    else:
-      self.surface.fill(self.fill_color)
 
   def update(self, tick):
     if self.cycles >= 18:
@@ -175,8 +268,10 @@ class ScoreAnimation(object):
       return
 
     self.elapsed += tick
-    if (self.cycles >= 1 and self.elapsed > 50) or self.elapsed > 600:
-      self.elapsed = 0
+    # Shows the score for a while, then blinks it quickly.
+    period = 600 if self.cycles == 0 else 50
+    if self.elapsed >= period:
+      self.elapsed -= period
       self.cycles += 1
       self.showing = not self.showing
 
@@ -188,34 +283,46 @@ class GetReadyDisplay(object):
     self.blink_elapsed = 0
     self.elapsed = 0
     self.countdown = 5
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    screen.fill(clr_neon_blue)
-    if self.display_player:
-      player_string = 'Player %s' % self.display_player
-      txt_player = fnt_arcade_100.render(player_string, 1, clr_neon_pink)
-      player_x = (width - txt_player.get_width()) // 2
-      screen.blit(txt_player, (player_x, 100))
-
-    if self.showing:
-      txt_ready = fnt_arcade_100.render('Get ready!', 1, clr_neon_pink)
-      ready_x = (width - txt_ready.get_width()) // 2
-      screen.blit(txt_ready, (ready_x, 225))
-
-    txt_countdown = fnt_arcade_140.render(str(self.countdown), 1, clr_black)
-    countdown_x = (width - txt_countdown.get_width()) // 2
-    screen.blit(txt_countdown, (countdown_x, 400))
+    rect = (0, 0, width, 225)
+    if self.dirty.track(rect, self.display_player):
+      screen.fill(clr_neon_blue, rect)
+      if self.display_player:
+        player_string = 'Player %s' % self.display_player
+        txt_player = fnt_arcade_100.render(player_string, 1, clr_neon_pink)
+        player_x = (width - txt_player.get_width()) // 2
+        screen.blit(txt_player, (player_x, 100))
+
+    rect = (0, 225, width, 175)
+    if self.dirty.track(rect, self.showing):
+      screen.fill(clr_neon_blue, rect)
+      if self.showing:
+        txt_ready = fnt_arcade_100.render('Get ready!', 1, clr_neon_pink)
+        ready_x = (width - txt_ready.get_width()) // 2
+        screen.blit(txt_ready, (ready_x, 225))
+
+    rect = (0, 400, width, height - 400)
+    if self.dirty.track(rect, self.countdown):
+      screen.fill(clr_neon_blue, rect)
+      txt_countdown = fnt_arcade_140.render(str(self.countdown), 1, clr_black)
+      countdown_x = (width - txt_countdown.get_width()) // 2
+      screen.blit(txt_countdown, (countdown_x, 400))
+
+  def dirty_rects(self):
+    return self.dirty.pop()
 
   def update(self, tick):
     self.blink_elapsed += tick
     self.elapsed += tick
 
-    if self.blink_elapsed > 100:
-      self.blink_elapsed = 0
+    if self.blink_elapsed >= 100:
+      self.blink_elapsed -= 100
       self.showing = not self.showing
 
     if self.elapsed >= 1000:
-      self.elapsed = 0
+      self.elapsed -= 1000
       self.countdown -= 1
       if self.countdown == 0:
         self.game.start_game()
@@ -226,49 +333,57 @@ class GetReadyDisplay(object):
 class MainDisplay(object):
   def __init__(self, game):
     self.game = game
-    self.top = pygame.Surface(half)
-    self.bottom = pygame.Surface(half)
+    self.top = surface_pool.borrow(self, half)
+    self.bottom = surface_pool.borrow(self, half)
     self.txt_score_header = fnt_arcade_100.render('SCORE:', 1, clr_neon_pink)
     self.txt_time_header = fnt_arcade_100.render('TIME:', 1, clr_black)
     self.animate_score = None
+    self.dirty = DirtyRegions()
 
     self.rem_secs = GAME_DURATION_SECS
     self.elapsed = 0
     if USE_MUSIC:
-      pygame.mixer.music.load('game_loop.wav')
-      pygame.mixer.music.play(-1)
+      music.play('game')
 
   def draw(self):
-    txt_score = fnt_arcade_140.render(str(game.score), 1, clr_neon_pink)
-    txt_time = fnt_arcade_140.render(str(self.rem_secs), 1, clr_black)
-    self.top.fill(clr_neon_blue)
+    if self.dirty.track(rect_top_half, game.score, self.rem_secs):
+      txt_score = fnt_arcade_140.render(str(game.score), 1, clr_neon_pink)
+      txt_time = fnt_arcade_140.render(str(self.rem_secs), 1, clr_black)
+      self.top.fill(clr_neon_blue)
+      self.top.blit(self.txt_score_header, (10, -5))
+      self.top.blit(self.txt_time_header, (640, -5))
+      self.top.blit(txt_score, (40, 110))
+      self.top.blit(txt_time, (680, 110))
+      screen.blit(self.top, (0, 0))
+
+    animation = None
     if self.animate_score:
-      self.animate_score.draw()
-    else:
-      self.bottom.fill(clr_black)
+      animation = (id(self.animate_score), self.animate_score.showing)
+    if self.dirty.track(rect_bottom_half, animation):
+      if self.animate_score:
+        self.animate_score.draw()
+      else:
+        self.bottom.fill(clr_black)
+      screen.blit(self.bottom, (0, height//2))
 
-    self.top.blit(self.txt_score_header, (10, -5))
-    self.top.blit(self.txt_time_header, (640, -5))
-    self.top.blit(txt_score, (40, 110))
-    self.top.blit(txt_time, (680, 110))
-    screen.blit(self.top, (0, 0))
-    screen.blit(self.bottom, (0, height//2))
+  def dirty_rects(self):
+    return self.dirty.pop()
 
   def update(self, tick):
     if self.animate_score:
       self.animate_score.update(tick)
 
     self.elapsed += tick
-    if self.elapsed > 1000:
-      self.elapsed = 0
+    if self.elapsed >= 1000:
+      self.elapsed -= 1000
       self.rem_secs -= 1
       if self.rem_secs == GAME_DURATION_SECS//3:
         if USE_MUSIC:
-          pygame.mixer.music.load('game_loop_hurry.wav')
-          pygame.mixer.music.play(-1)
+          music.switch('hurry', fade_ms=MUSIC_CROSSFADE_MS,
+                       on_beats=MUSIC_SWITCH_BEATS)
       if self.rem_secs < 0:
         if USE_MUSIC:
-          pygame.mixer.music.stop()
+          music.stop()
         self.game.goto_drink()
 
   def handle_key(self, keycode):
@@ -286,22 +401,29 @@ class PlayerSelectDisplay(object):
   def __init__(self, game):
     self.game = game
     self.elapsed = 0
-    self.top = pygame.Surface(quarter)
-    self.bottom = pygame.Surface(three_quarters)
+    self.top = surface_pool.borrow(self, quarter)
+    self.bottom = surface_pool.borrow(self, three_quarters)
     self.selection_showing = True
     self.left_arrow = Arrow('<', self)
     self.right_arrow = Arrow('>', self)
     self.focus = 'left'
     self.players = 1
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    self.top.fill(clr_black)
+    if self.dirty.track(rect_top_quarter):
+      self.top.fill(clr_black)
+      txt_many = fnt_arcade_80.render('How many players?', 1, clr_white)
+      many_x = (width - txt_many.get_width()) // 2
+      many_y = (height // 4 - txt_many.get_height()) // 2
+      self.top.blit(txt_many, (many_x, many_y))
+      screen.blit(self.top, (0, 0))
+
+    if not self.dirty.track(rect_bottom_three_quarters,
+                            self.left_arrow.active, self.right_arrow.active,
+                            self.selection_showing, self.players):
+      return
     self.bottom.fill(clr_neon_yellow)
-    txt_many = fnt_arcade_80.render('How many players?', 1, clr_white)
-    many_x = (width - txt_many.get_width()) // 2
-    many_y = (height // 4 - txt_many.get_height()) // 2
-    self.top.blit(txt_many, (many_x, many_y))
-
     self.left_arrow.draw(self.bottom, (10, 150))
     self.right_arrow.draw(self.bottom, (900, 150))
 
@@ -315,15 +437,17 @@ class PlayerSelectDisplay(object):
                    NAME_OFFSET_Y // 2)
       self.bottom.blit(txt_players, (players_x, players_y))
 
-    screen.blit(self.top, (0, 0))
     screen.blit(self.bottom, (0, height//4))
 
+  def dirty_rects(self):
+    return self.dirty.pop()
+
   def update(self, tick):
     self.left_arrow.update(tick)
     self.right_arrow.update(tick)
     self.elapsed += tick
-    if self.elapsed > 150:
-      self.elapsed = 0
+    if self.elapsed >= 150:
+      self.elapsed -= 150
       self.selection_showing = not self.selection_showing
 
   def handle_key(self, keycode):
@@ -371,12 +495,13 @@ class Arrow(object):
     if not self.animating:
       return
     self.elapsed += tick
-    if self.elapsed > 60:
-      self.elapsed = 0
+    if self.elapsed >= 60:
+      self.elapsed -= 60
       self.active = not self.active
       self.cycles += 1
       if self.cycles > 5:
         self.cycles = 0
+        self.elapsed = 0
         self.active = False
         self.animating = False
         self.state.animation_done()
@@ -386,16 +511,16 @@ class DrinkDisplay(object):
     self.game = game
     self.display_player = display_player
     self.elapsed = 0
-    self.top = pygame.Surface(quarter)
-    self.bottom = pygame.Surface(three_quarters)
+    self.top = surface_pool.borrow(self, quarter)
+    self.bottom = surface_pool.borrow(self, three_quarters)
     self.drink_showing = True
     self.left_arrow = Arrow('<', self)
     self.right_arrow = Arrow('>', self)
     self.focus = 'left'
+    self.dirty = DirtyRegions()
     self.init_tier()
     if USE_MUSIC:
-      pygame.mixer.music.load('sound_fx/bass-z.wav')
-      pygame.mixer.music.play(-1)
+      music.play('bass')
 
   def init_tier(self):
     self.tiers = []
@@ -414,16 +539,23 @@ class DrinkDisplay(object):
       self.current_tier = self.tiers[-1]
     
   def draw(self):
-    self.top.fill(clr_black)
-    self.bottom.fill(clr_neon_blue)
     score_string = 'Score: %s pts' % self.game.score
     if self.display_player:
       score_string = 'Player %s: %s pts' % (
         self.display_player, self.game.score)
+    # The tier lines up with the score.
     txt_score = fnt_arcade_80.render(score_string, 1, clr_white)
     score_x = (width - txt_score.get_width()) // 2
-    self.top.blit(txt_score, (score_x, 20))
-
+    if self.dirty.track(rect_top_quarter, score_string):
+      self.top.fill(clr_black)
+      self.top.blit(txt_score, (score_x, 20))
+      screen.blit(self.top, (0, 0))
+
+    if not self.dirty.track(rect_bottom_three_quarters,
+                            self.left_arrow.active, self.right_arrow.active,
+                            self.drink_showing, self.current_tier['tier']):
+      return
+    self.bottom.fill(clr_neon_blue)
     self.left_arrow.draw(self.bottom, (10, 150))
     self.right_arrow.draw(self.bottom, (900, 150))
 
@@ -462,15 +594,17 @@ class DrinkDisplay(object):
       locked_y = (height * 3 // 4 - txt_locked.get_height() - 20)
       self.bottom.blit(txt_locked, (locked_x, locked_y))
 
-    screen.blit(self.top, (0, 0))
     screen.blit(self.bottom, (0, height//4))
 
+  def dirty_rects(self):
+    return self.dirty.pop()
+
   def update(self, tick):
     self.left_arrow.update(tick)
     self.right_arrow.update(tick)
     self.elapsed += tick
-    if self.elapsed > 150:
-      self.elapsed = 0
+    if self.elapsed >= 150:
+      self.elapsed -= 150
       self.drink_showing = not self.drink_showing
 
   def handle_key(self, keycode):
@@ -539,8 +673,8 @@ class Initials(object):
 
   def update(self, tick):
     self.elapsed += tick
-    if self.elapsed > 150:
-      self.elapsed = 0
+    if self.elapsed >= 150:
+      self.elapsed -= 150
       self.cur_showing = not self.cur_showing
 
   def go_up(self):
@@ -592,34 +726,40 @@ class EnterScoreDisplay(object):
     self.game = game
     self.display_player = display_player
     self.elapsed = 0
-    self.top = pygame.Surface(quarter)
-    self.middle = pygame.Surface(quarter)
-    self.bottom = pygame.Surface(half)
+    self.top = surface_pool.borrow(self, quarter)
+    self.middle = surface_pool.borrow(self, quarter)
+    self.bottom = surface_pool.borrow(self, half)
     self.initials = Initials(self)
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    self.top.fill(clr_black)
-    self.middle.fill(clr_neon_green)
-    self.bottom.fill(clr_neon_green)
-
     score_string = 'Score: %s pts' % self.game.score
     if self.display_player:
       score_string = 'Player %s: %s pts' % (
         self.display_player, self.game.score)
-    txt_score = fnt_arcade_80.render(score_string, 1, clr_white)
-    score_x = (width - txt_score.get_width()) // 2
-    self.top.blit(txt_score, (score_x, 20))
-
-    txt_enter = fnt_arcade_80.render(
-      'Enter your initials', 1, clr_black)
-    enter_x = (width - txt_enter.get_width()) // 2
-    self.middle.blit(txt_enter, (enter_x, 20))
-
-    self.initials.draw(self.bottom)
-
-    screen.blit(self.top, (0, 0))
-    screen.blit(self.middle, (0, height//4))
-    screen.blit(self.bottom, (0, height//2))
+    if self.dirty.track(rect_top_quarter, score_string):
+      self.top.fill(clr_black)
+      txt_score = fnt_arcade_80.render(score_string, 1, clr_white)
+      score_x = (width - txt_score.get_width()) // 2
+      self.top.blit(txt_score, (score_x, 20))
+      screen.blit(self.top, (0, 0))
+
+    if self.dirty.track((0, height//4, width, height//4)):
+      self.middle.fill(clr_neon_green)
+      txt_enter = fnt_arcade_80.render(
+        'Enter your initials', 1, clr_black)
+      enter_x = (width - txt_enter.get_width()) // 2
+      self.middle.blit(txt_enter, (enter_x, 20))
+      screen.blit(self.middle, (0, height//4))
+
+    if self.dirty.track(rect_bottom_half, tuple(self.initials.ltr_indices),
+                        self.initials.top_idx, self.initials.cur_showing):
+      self.bottom.fill(clr_neon_green)
+      self.initials.draw(self.bottom)
+      screen.blit(self.bottom, (0, height//2))
+
+  def dirty_rects(self):
+    return self.dirty.pop()
 
   def update(self, tick):
     self.initials.update(tick)
@@ -633,18 +773,7 @@ class EnterScoreDisplay(object):
       self.initials.enter()
 
   def record_score(self, name):
-    if os.path.isfile('scores.json'):
-      scores = json.load(open('scores.json'))
-    else:
-      scores = []
-    idx = len(scores)
-    for i, (_, score) in enumerate(scores):
-      if game.score > score:
-        idx = i
-        break
-
-    scores.insert(idx, [name, game.score])
-    json.dump(scores, open('scores.json', 'w'))
+    score_store.add(name, game.score)
     self.game.set_cur_player_initials(name)
     self.game.next_cycle()
 
@@ -652,24 +781,16 @@ class WinnerDisplay(object):
   def __init__(self, game):
     self.game = game
     self.elapsed = 0
-    self.top = pygame.Surface(quarter)
+    self.top = surface_pool.borrow(self, quarter)
     self.bottoms = []
     for i in range(4):
-      self.bottoms.append(pygame.Surface((width // 2, height * 3 // 8)))
+      self.bottoms.append(
+        surface_pool.borrow(self, (width // 2, height * 3 // 8)))
     self.showing = True
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    self.top.fill(clr_black)
-
     winner_string = self.get_winners()
-    if len(winner_string) > 20:
-      txt_winner = fnt_arcade_50.render(winner_string, 1, clr_white)
-    else:
-      txt_winner = fnt_arcade_80.render(winner_string, 1, clr_white)
-    winner_x = (width - txt_winner.get_width()) // 2
-    winner_y = (height // 4 - txt_winner.get_height()) // 2
-    self.top.blit(txt_winner, (winner_x, winner_y))
-
     coords = (
       (0, self.top.get_height()),
       (width // 2, self.top.get_height()),
@@ -677,6 +798,10 @@ class WinnerDisplay(object):
       (width // 2, (height + self.top.get_height()) // 2)
     )
     for i, (disp, coord) in enumerate(zip(self.bottoms, coords)):
+      blinking = i < self.game.total_players and i + 1 in self.winning_players
+      if not self.dirty.track(disp.get_rect(topleft=coord),
+                              blinking and self.showing):
+        continue
       disp.fill(clr_neon_yellow)
       if i < self.game.total_players:
         color = clr_black
@@ -694,12 +819,25 @@ class WinnerDisplay(object):
           score_y = initials_y + txt_initials.get_height()
           disp.blit(txt_score, (score_x, score_y))
       screen.blit(disp, coord)
-    screen.blit(self.top, (0,0))
+
+    if self.dirty.track(rect_top_quarter, winner_string):
+      self.top.fill(clr_black)
+      if len(winner_string) > 20:
+        txt_winner = fnt_arcade_50.render(winner_string, 1, clr_white)
+      else:
+        txt_winner = fnt_arcade_80.render(winner_string, 1, clr_white)
+      winner_x = (width - txt_winner.get_width()) // 2
+      winner_y = (height // 4 - txt_winner.get_height()) // 2
+      self.top.blit(txt_winner, (winner_x, winner_y))
+      screen.blit(self.top, (0,0))
+
+  def dirty_rects(self):
+    return self.dirty.pop()
 
   def update(self, tick):
     self.elapsed += tick
-    if self.elapsed > 50:
-      self.elapsed = 0
+    if self.elapsed >= 50:
+      self.elapsed -= 50
       self.showing = not self.showing
 
   def handle_key(self, keycode):
@@ -723,78 +861,164 @@ class WinnerDisplay(object):
     else:
       return 'Player %s wins!' % winning_players[0]
 
+class ScoreScroller(object):
+  """Draws a window of the leaderboard without rebuilding it every frame.
+
+  Rows are rendered once, a tile of rows at a time, into surfaces that are
+  kept while they are on screen. Blinking rows are hidden by painting over
+  them, so the cost of a frame does not depend on the number of scores.
+  """
+  rows_per_tile = 8
+
+  def __init__(self, scores, participants):
+    self.scores = scores
+    self.participant_rows = [
+      i for i, (name, score) in enumerate(scores)
+      if (name, score) in participants]
+    self.participant_rows_set = set(self.participant_rows)
+    self.top_height = fnt_mono_120.get_height()
+    self.row_height = fnt_mono_100.get_height()
+    self.height = self.row_top(len(scores))
+    self.width = 0
+    if scores:
+      longest = max((self.score_line(i) for i in range(min(3, len(scores)))),
+                    key=len)
+      self.width = fnt_mono_120.size(longest)[0]
+    if len(scores) > 3:
+      name_len = max(len(name) for name, _ in scores)
+      longest = self.score_line(len(scores) - 1, name=' ' * name_len,
+                                score=scores[3][1])
+      self.width = max(self.width, fnt_mono_100.size(longest)[0])
+    self.tiles = {}
+
+  def score_line(self, i, name=None, score=None):
+    if name is None:
+      name, score = self.scores[i]
+    score_str = str(score)
+    while len(score_str) < 4:
+      score_str = ' ' + score_str
+    return '%s. %s %s' % (i+1, name, score_str)
+
+  def row_top(self, i):
+    if i < 3:
+      return i * self.top_height
+    return 3 * self.top_height + (i - 3) * self.row_height
+
+  def row_at(self, y):
+    if y < 3 * self.top_height:
+      i = y // self.top_height
+    else:
+      i = 3 + (y - 3 * self.top_height) // self.row_height
+    return max(0, min(i, len(self.scores) - 1))
+
+  def get_tile(self, k):
+    tile = self.tiles.get(k)
+    if tile is None:
+      first = k * self.rows_per_tile
+      last = min(first + self.rows_per_tile, len(self.scores))
+      tile = pygame.Surface(
+        (self.width, self.row_top(last) - self.row_top(first)))
+      tile.fill(clr_neon_pink)
+      for i in range(first, last):
+        color = clr_neon_blue
+        if i in self.participant_rows_set:
+          color = clr_neon_yellow
+        fnt = fnt_mono_120 if i < 3 else fnt_mono_100
+        # Straight to the font: every row is rendered exactly once, so going
+        # through the text cache would only evict strings worth keeping.
+        txt = fnt.font.render(self.score_line(i), 1, color)
+        tile.blit(txt, ((self.width - txt.get_width()) // 2,
+                        self.row_top(i) - self.row_top(first)))
+      self.tiles[k] = tile
+    return tile
+
+  def draw(self, surface, left, top, show_top, show_participant):
+    surface.fill(clr_neon_pink, rect_full)
+    if not self.scores:
+      return
+    first = self.row_at(-top)
+    last = self.row_at(height - top)
+    visible = range(first // self.rows_per_tile,
+                    last // self.rows_per_tile + 1)
+    for k in list(self.tiles):
+      if k not in visible:
+        del self.tiles[k]
+    clip = surface.get_clip()
+    surface.set_clip(rect_full)
+    for k in visible:
+      surface.blit(self.get_tile(k),
+                   (left, top + self.row_top(k * self.rows_per_tile)))
+    surface.set_clip(clip)
+
+    hidden = []
+    if not show_top:
+      hidden.append(0)
+    if not show_participant:
+      lo = bisect.bisect_left(self.participant_rows, first)
+      hi = bisect.bisect_right(self.participant_rows, last)
+      hidden.extend(self.participant_rows[lo:hi])
+    for i in hidden:
+      row_height = self.top_height if i < 3 else self.row_height
+      # Clip first: fill() keeps the full height of a rect hanging off the
+      # top of the surface.
+      row = pygame.Rect(left, top + self.row_top(i), self.width, row_height)
+      surface.fill(clr_neon_pink, row.clip(rect_full))
+
 class HighScoresDisplay(object):
-  def __init__(self, game):
+  scroll_step_ms = 33
+
+  def __init__(self, game, view='all'):
     self.game = game
-    if os.path.isfile('scores.json'):
-      self.scores = json.load(open('scores.json'))
-    else:
-      # Skip showing the scores if there are none.
-      self.scores = []
-    self.cur_top = None
-    self.start_top = None
+    # An empty leaderboard skips showing the scores.
+    self.scores = score_store.leaderboard(view)
+    self.txt_title = None
+    title = VIEW_TITLES[view]
+    if title:
+      if '%s' in title:
+        title = title % len(self.scores)
+      self.txt_title = fnt_arcade_50.render(title, 1, clr_neon_yellow)
+    participants = set(
+      (s[1], s[0]) for s in self.game.scores if len(s) == 2)
+    self.scroller = ScoreScroller(self.scores, participants)
+    self.start_top = self.cur_top = height - self.scroller.height
+    mod = self.cur_top % 3
+    if mod != 0:
+      if self.cur_top < 0:
+        self.cur_top -= mod
+      else:
+        self.cur_top += mod
     self.elapsed = 0
     self.elapsed_participant = 0
     self.total_elapsed = 0
+    self.scroll_elapsed = 0
     self.show_top = True
     self.show_participant = True
     self.distance = 0
     self.velocity = 2
     self.accel = 1
     self.started_pos = False
+    self.dirty = DirtyRegions()
 
   def draw(self):
-    bg = pygame.Surface((width, height))
-
-    score_surfaces = []
-    total_height = 0
-    total_width = 0
-    for i, (name, score) in enumerate(self.scores):
-      is_participant = [score, name] in self.game.scores
-      score_str = str(score)
-
-      while len(score_str) < 4:
-        score_str = ' ' + score_str
-
-      color = clr_neon_blue
-      if is_participant:
-        color = clr_neon_yellow
-
-      if i < 3:
-        score_line = '%s. %s %s' % (i+1, name, score_str)
-        if i == 0 and not self.show_top:
-          score_line = ' '
-        if is_participant and not self.show_participant:
-          score_line = ' '
-        txt = fnt_mono_120.render(score_line, 1, color)
-      else:
-        score_line = '%s. %s %s' % (i+1, name, score_str)
-        if is_participant and not self.show_participant:
-          score_line = ' '
-        txt = fnt_mono_100.render(score_line, 1, color)
-      score_surfaces.append(txt)
-      total_height += txt.get_height()
-      if txt.get_width() > total_width:
-        total_width = txt.get_width()
-
-    scroll = pygame.Surface((total_width, total_height))
-    scroll.fill(clr_neon_pink)
-    cur_height = 0
-    for txt in score_surfaces:
-      scroll.blit(txt, ((total_width - txt.get_width())/2, cur_height))
-      cur_height += txt.get_height()
-
-    bg.fill(clr_neon_pink)
-    if self.cur_top is None:
-      self.start_top = self.cur_top = height - total_height
-      mod = self.cur_top % 3
-      if mod != 0:
-        if self.cur_top < 0:
-          self.cur_top -= mod
-        else:
-          self.cur_top += mod
-    bg.blit(scroll, ((width - total_width)//2, self.cur_top))
-    screen.blit(bg, (0, 0))
+    if not self.dirty.track(rect_full, self.cur_top, self.show_top,
+                            self.show_participant):
+      return
+    self.scroller.draw(screen, (width - self.scroller.width) // 2,
+                       self.cur_top, self.show_top, self.show_participant)
+    if self.txt_title:
+      title_x = (width - self.txt_title.get_width()) // 2
+      screen.blit(self.txt_title, (title_x, 10))
+
+  def dirty_rects(self):
+    return self.dirty.pop()
+
+  def next_change_ms(self):
+    due = [80 - self.elapsed_participant]
+    if self.cur_top == 0:
+      due += [80 - self.elapsed, 6000 - self.total_elapsed]
+    else:
+      due.append(self.scroll_step_ms - self.scroll_elapsed)
+    return min(due)
 
   def update(self, tick):
     self.elapsed += tick
@@ -803,27 +1027,32 @@ class HighScoresDisplay(object):
       self.game.goto_game_over()
       return
 
-    if self.elapsed_participant > 80:
-      self.elapsed_participant = 0
+    if self.elapsed_participant >= 80:
+      self.elapsed_participant -= 80
       self.show_participant = not self.show_participant
 
     if ((self.cur_top <= 0 and self.start_top > 0) or 
         (self.cur_top >= 0 and self.start_top < 0)):
       self.cur_top = 0
       self.total_elapsed += tick
-      if self.elapsed > 80:
+      if self.elapsed >= 80:
         self.show_top = not self.show_top
-        self.elapsed = 0
+        self.elapsed -= 80
       if self.total_elapsed > 6000:
         self.game.goto_game_over()
         return
-    elif self.cur_top > 0:
-      self.cur_top -= self.velocity
-    elif self.cur_top < 0:
-      self.cur_top += self.velocity
-
-    if self.elapsed > 150:
-      self.elapsed = 0
+    else:
+      # velocity pixels every scroll_step_ms, which used to be every frame.
+      self.scroll_elapsed += tick
+      while self.scroll_elapsed >= self.scroll_step_ms:
+        self.scroll_elapsed -= self.scroll_step_ms
+        if self.cur_top > 0:
+          self.cur_top -= self.velocity
+        elif self.cur_top < 0:
+          self.cur_top += self.velocity
+
+    if self.elapsed >= 150:
+      self.elapsed -= 150
       self.velocity += self.accel
 
   def handle_key(self, keycode):
@@ -835,24 +1064,30 @@ class OutOfOrderDisplay(object):
     self.game = game
     self.elapsed = 0
     self.idx = 0
+    self.dirty = DirtyRegions()
     if USE_MUSIC:
-      pygame.mixer.music.stop()
+      music.stop()
 
   def draw(self):
+    frame = spinner_frames.get(self.idx)
+    if not self.dirty.track(rect_full, self.idx, frame is not None):
+      return
     screen.fill(clr_neon_blue)
-    screen.blit(spinner_surfaces[self.idx], (0, 0))
+    if frame:
+      screen.blit(frame, (0, 0))
 
     txt_out = fnt_arcade_100.render('Out of Order', 1, clr_neon_pink)
     out_x = (width - txt_out.get_width()) // 2
     screen.blit(txt_out, (out_x, 100))
 
+  def dirty_rects(self):
+    return self.dirty.pop()
+
   def update(self, tick):
     self.elapsed += tick
-    if self.elapsed > 30:
-      self.elapsed = 0
-      self.idx += 1
-      if self.idx == len(spinner_surfaces):
-        self.idx = 0
+    if self.elapsed >= 30:
+      self.elapsed -= 30
+      self.idx = spinner_frames.next_index(self.idx)
 
   def handle_key(self, keycode):
     pass
@@ -861,37 +1096,55 @@ class PleaseWaitDisplay(object):
   def __init__(self, game):
     self.game = game
     self.elapsed = 0
-    self.elapsed_poll = 0
     self.idx = 0
     self.drink_for = game.drink_for
-    self.done_pouring = False
+    self.tier = game.drink_to_pour_tier
+    self.done_pouring = not robot.is_pouring_drink(self.tier)
+    self.remaining_secs = 0
+    self.update_remaining()
+    self.dirty = DirtyRegions()
+    robot.add_listener(self.pour_event, weak=True)
+
+  def pour_event(self, what, pour):
+    if what == 'finish' and not robot.is_pouring_drink(self.tier):
+      self.done_pouring = True
+
+  def update_remaining(self):
+    ms = robot.time_until_free_ms(self.tier)
+    self.remaining_secs = int(math.ceil(ms / 1000))
 
   def draw(self):
+    frame = spinner_frames.get(self.idx)
+    if self.done_pouring:
+      wait_string = 'Done pouring'
+    else:
+      wait_string = 'Please Wait %d:%02d' % divmod(self.remaining_secs, 60)
+    if not self.dirty.track(rect_full, self.idx, frame is not None,
+                            wait_string):
+      return
     screen.fill(clr_neon_blue)
-    screen.blit(spinner_surfaces[self.idx], (0, 0))
+    if frame:
+      screen.blit(frame, (0, 0))
 
     pouring_string = 'Pouring drink for %s' % self.drink_for
     txt_pouring = fnt_arcade_50.render(pouring_string, 1, clr_neon_pink)
     pouring_x = (width - txt_pouring.get_width()) // 2
     screen.blit(txt_pouring, (pouring_x, 100))
 
-    wait_string = 'Done pouring' if self.done_pouring else 'Please Wait'
     txt_wait = fnt_arcade_50.render(wait_string, 1, clr_neon_pink)
     wait_x = (width - txt_wait.get_width()) // 2
     screen.blit(txt_wait, (wait_x, 100 + txt_pouring.get_height()))
 
+  def dirty_rects(self):
+    return self.dirty.pop()
+
   def update(self, tick):
     self.elapsed += tick
-    self.elapsed_poll += tick
-    if self.elapsed > 30:
-      self.elapsed = 0
-      self.idx += 1
-      if self.idx == len(spinner_surfaces):
-        self.idx = 0
-    if self.elapsed_poll > 6000:
-      self.elapsed_poll = 0
-      if not robot.is_pouring_drink():
-        self.done_pouring = True
+    if self.elapsed >= 30:
+      self.elapsed -= 30
+      self.idx = spinner_frames.next_index(self.idx)
+    if not self.done_pouring:
+      self.update_remaining()
 
   def handle_key(self, keycode):
     if keycode == pygame.K_SPACE and self.done_pouring:
@@ -900,22 +1153,152 @@ class PleaseWaitDisplay(object):
 class Game(object):
   def __init__(self):
     self.clock = pygame.time.Clock()
+    self.max_fps = MAX_FPS
+    # With step_ms set the states move on in steps of exactly that many ms,
+    # as many of them as the time since the last frame covers.
+    self.step_ms = FIXED_STEP_MS
+    self.accumulator = 0
+    self.last_time = time.monotonic()
+    # Advance the displays by this many ms every frame instead of by the real
+    # time that passed, for benchmarks.
+    self.fixed_tick = None
+    # How far the last update moved the game on, in ms.
+    self.last_tick = 0
     self.current_state = GameOverDisplay(self)
     self.score = 0
     self.scores = []
     self.participants = []
     self.total_players = 1
     self.drink_for = None
+    self.high_scores_shown = 0
+    # Drinks still pouring, or waiting to, while the game goes on: each is
+    # [pour, player number, name to show].
+    self.pours = []
+    self.ticker = None
+
+  @property
+  def current_state(self):
+    return self._current_state
+
+  @current_state.setter
+  def current_state(self, state):
+    # The display we move on from hands its surfaces back for the next ones.
+    old = getattr(self, '_current_state', None)
+    self._current_state = state
+    if old is not None and old is not state:
+      surface_pool.release(old)
 
   def handle_key(self, keycode):
     self.current_state.handle_key(keycode)
 
-  def draw(self):
-    self.current_state.draw()
-
-  def update(self):
-    tick = self.clock.tick(30)
-    result = self.current_state.update(tick)
+  def draw(self, full_frame=True):
+    """Draws the regions of the current state that changed, or all of them."""
+    state = self.current_state
+    with profiler.time_phase('draw', state):
+      ticker = None
+      # The wait screen shows the pour it waits for itself.
+      if NONBLOCKING_POURS and not isinstance(state, PleaseWaitDisplay):
+        ticker = self.pour_ticker()
+      if full_frame:
+        state.dirty.invalidate()
+      elif ticker != self.ticker:
+        # The ticker sits on top of the state, which draws what it uncovers.
+        state.dirty.invalidate(rect_ticker)
+      self.ticker = ticker
+      state.draw()
+      if self.ticker and state.dirty.touches(rect_ticker):
+        self.draw_ticker()
+
+  def draw_ticker(self):
+    screen.fill(clr_black, rect_ticker)
+    txt_ticker = fnt_mono_24.render(self.ticker, 1, clr_neon_yellow)
+    screen.blit(txt_ticker, (10, rect_ticker.top + (
+      rect_ticker.height - txt_ticker.get_height()) // 2))
+
+  def pour_ticker(self):
+    """A line about every drink that is pouring, queued or just done."""
+    now = robot.now()
+    items = []
+    pours = []
+    for pour, player, name in self.pours:
+      if pour.finished_at is not None:
+        if now - pour.finished_at > POUR_TICKER_DONE_SECS:
+          continue
+        items.append('%s: %s ready' % (name, pour.drink))
+      elif pour.started_at is None:
+        items.append('%s: %s queued' % (name, pour.drink))
+      else:
+        secs = int(math.ceil(pour.remaining_ms(now) / 1000))
+        items.append('%s: %s %d:%02d' % ((name, pour.drink) + divmod(secs, 60)))
+      pours.append([pour, player, name])
+    self.pours = pours
+    return '   '.join(items)
+
+  def ticker_change_ms(self):
+    """How long until the ticker reads differently."""
+    now = robot.now()
+    due = []
+    for pour, _, _ in self.pours:
+      if pour.finished_at is not None:
+        # Until it drops off.
+        due.append(
+          (pour.finished_at + POUR_TICKER_DONE_SECS - now) * 1000)
+      elif pour.started_at is not None:
+        # Its time left counts down from when it started.
+        due.append(pour.remaining_ms(now) % 1000 or 1000)
+    # Queued drinks only change when a pour timer fires, which wakes the
+    # loop anyway.
+    return max(min(due), 0) if due else 1000
+
+  def dirty_rects(self):
+    return self.current_state.dirty_rects()
+
+  def static_key(self):
+    """Identifies the frame when the current state drew a static image."""
+    if self.ticker:
+      # The frame has the ticker on it, which changes by itself.
+      return None
+    get_key = getattr(self.current_state, 'static_key', None)
+    return get_key() if get_key else None
+
+  def next_change_ms(self):
+    """How long until the current state will look different, if it knows.
+
+    Only the attract screens say; the screens that are played keep running
+    at the full frame rate.
+    """
+    get_due = getattr(self.current_state, 'next_change_ms', None)
+    if not get_due:
+      return None
+    due = max(get_due(), 0)
+    if self.ticker:
+      due = min(due, self.ticker_change_ms())
+    if self.step_ms:
+      # The state only sees whole steps, some of which are already banked.
+      due = math.ceil(due / self.step_ms) * self.step_ms - self.accumulator
+    return max(due, 0)
+
+  def update(self, tick=None):
+    """Moves the game on by tick ms, by default the time since last frame."""
+    if tick is None:
+      # Kept out of the update timing: most of it is sleeping off the frame.
+      with profiler.time_phase('tick'):
+        self.clock.tick(self.max_fps)
+      now = time.monotonic()
+      tick = (now - self.last_time) * 1000
+      self.last_time = now
+      if self.fixed_tick is not None:
+        tick = self.fixed_tick
+    self.last_tick = tick
+    with profiler.time_phase('update', self.current_state):
+      if not self.step_ms:
+        self.current_state.update(tick)
+        return
+      self.accumulator += tick
+      while self.accumulator >= self.step_ms:
+        self.accumulator -= self.step_ms
+        # The state can change mid-frame; the rest of the time is its own.
+        self.current_state.update(self.step_ms)
 
   def start_game(self):
     self.score = 0
@@ -956,7 +1339,11 @@ class Game(object):
     self.current_state = TitleDisplay(self)
 
   def goto_high_scores(self):
-    self.current_state = HighScoresDisplay(self)
+    # Take turns between the leaderboards the score store can show.
+    views = score_store.views
+    view = views[self.high_scores_shown % len(views)]
+    self.high_scores_shown += 1
+    self.current_state = HighScoresDisplay(self, view)
 
   def goto_drink(self):
     self.scores.append([self.score])
@@ -977,6 +1364,9 @@ class Game(object):
     if not self.drink_for:
       self.drink_for = initials
     self.scores[self._get_cur_player() - 1].append(initials)
+    # Put a name to the drink the player just picked.
+    if self.pours and self.pours[-1][1] == self._get_cur_player():
+      self.pours[-1][2] = initials
 
   def set_drink_to_pour(self, tier):
     self.drink_to_pour_tier = tier
@@ -985,11 +1375,18 @@ class Game(object):
     self.total_players = players
 
   def try_to_pour_drink(self, blocking=False):
-    if robot.is_pouring_drink():
+    # Without NONBLOCKING_POURS the game waits for the tier to be free;
+    # with it the robot queues the drink and the game goes straight on.
+    if (not NONBLOCKING_POURS and
+        robot.is_pouring_drink(self.drink_to_pour_tier)):
       if blocking:
         self.current_state = PleaseWaitDisplay(self)
       return False
-    robot.pour_drink(self.drink_to_pour_tier)
+    pour = robot.pour_drink(self.drink_to_pour_tier)
+    if NONBLOCKING_POURS:
+      # For the ticker, which is all that keeps track of them.
+      player = self._get_cur_player()
+      self.pours.append([pour, player, 'Player %s' % player])
     self.poured_drink = True
     return True
 
@@ -998,32 +1395,173 @@ class Game(object):
 
 game = Game()
 
-mask = pygame.Surface((width, height))
-mask.fill(clr_white)
-for y in range(height):
-  if y % 5 == 0:
-    pygame.draw.line(mask, clr_black, (0, y), (width, y))
-mask.set_colorkey(clr_white)
-
-while True:
-  try:
-    for event in pygame.event.get():
-      if event.type == pygame.QUIT:
-        sys.exit()
-      elif event.type == pygame.KEYDOWN:
-        if event.key == pygame.K_ESCAPE:
-          sys.exit()
-        else:
-          game.handle_key(event.key)
-      elif event.type >= pygame.USEREVENT:
-        robot.handle_event_type(event.type)
-
-    screen.fill(clr_grey)
-
-    game.update()
-    game.draw()
-    screen.blit(mask, (0, 0))
-    pygame.display.flip()
-  except Exception:
-    print(traceback.format_exc())
-    game.goto_error()
+crt = CRTFilter((width, height), scanline_spacing=CRT_SCANLINE_SPACING,
+                scanline_level=CRT_SCANLINE_LEVEL, dim=CRT_DIM,
+                bloom=CRT_BLOOM, cache_frames=CRT_CACHE_FRAMES)
+
+def render_frame(drawn_state, tick=None, draw=True):
+  """Updates, draws and presents one frame.
+
+  drawn_state is the state the previous frame drew, the current state is
+  returned for the next one. Without draw only the game logic runs.
+  """
+  if not draw:
+    game.update(tick)
+    return game.current_state
+
+  game.update(tick)
+  full_frame = not (USE_DIRTY_RECTS and scaled_screen.partial_updates and
+                    game.current_state is drawn_state)
+  if full_frame:
+    with profiler.time_phase('fill'):
+      screen.fill(clr_grey)
+  elif profiler.overlay_rect:
+    # Whatever the overlay covers, or covered on the frame it was turned off,
+    # gets drawn again from scratch.
+    game.current_state.dirty.invalidate(profiler.overlay_rect)
+  game.draw(full_frame)
+  rects = game.dirty_rects()
+  # Drawn before the CRT pass like the rest of the screen. On partial frames
+  # the regions under it were invalidated, so they are among rects.
+  profiler.draw_overlay(screen)
+  # A frame with the overlay on it is no longer the static frame.
+  key = game.static_key() if not profiler.overlay_rect else None
+  with profiler.time_phase('crt'):
+    if full_frame:
+      crt.apply(screen, key=key)
+    else:
+      crt.apply(screen, rects)
+  with profiler.time_phase('flip'):
+    if full_frame:
+      # Always push the whole screen on the first frame of a new state.
+      scaled_screen.present(key=key)
+    else:
+      scaled_screen.present(rects)
+  return game.current_state
+
+def report_pour(what, pour):
+  if what == 'finish':
+    print('Poured %s in %d s, after waiting %d s; %s drinks in the last '
+          'hour' % (pour.drink, pour.finished_at - pour.started_at,
+                    pour.started_at - pour.requested_at,
+                    robot.pours_per_hour()))
+
+def finish_replay(replayer, started):
+  frame = profiler.summary().get('frame')
+  print('Replayed %s frames, %.1f s of game in %.2f s, ended on %s' % (
+    replayer.position, replayer.game_time_ms() / 1000,
+    time.perf_counter() - started, type(game.current_state).__name__))
+  # None when no frame got to the end without failing.
+  if frame:
+    print('Frame ms: p50 %s, p95 %s, max %s' % (
+      frame['p50'], frame['p95'], frame['max']))
+  score_writer.flush()
+  sys.exit()
+
+def main():
+  global robot, score_store
+  parser = argparse.ArgumentParser(description='Whiskey Ball')
+  parser.add_argument('--record', metavar='FILE',
+                      help='record every key press and tick to FILE')
+  parser.add_argument('--replay', metavar='FILE',
+                      help='play back a recording, unthrottled')
+  parser.add_argument('--no-draw', action='store_true',
+                      help='with --replay, only run the game logic')
+  parser.add_argument('--profile-startup', action='store_true',
+                      help='print how long every import and asset took')
+  args = parser.parse_args()
+
+  recorder = replayer = None
+  if args.replay:
+    replayer = Replayer(args.replay)
+    # Never pour real drinks or touch the real leaderboard from a replay.
+    robot = BaseRobot()
+    score_store = replayer.score_store(score_writer)
+    profiler.dump_path = None
+    replay_started = time.perf_counter()
+  robot.add_listener(report_pour)
+  if args.record:
+    recorder = Recorder(args.record, score_store.all(), SCORE_BACKEND,
+                        score_writer)
+    atexit.register(recorder.flush)
+
+  first_frame = True
+  prefetched = False
+  drawn_state = None
+  # Input that woke the loop up from idling, for the next frame.
+  woken_by = []
+  while True:
+    # Stays 0 if the frame fails before the update moves the game on.
+    game.last_tick = 0
+    profiler.start_frame()
+    events = woken_by + pygame.event.get()
+    woken_by = []
+    tick = None
+    if replayer:
+      # Live input only gets to stop the replay; everything else, timers
+      # included, comes from the recording. Outside the try below, so a
+      # replay that ends on a crash still ends.
+      for event in events:
+        if (event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and
+                                          event.key == pygame.K_ESCAPE)):
+          finish_replay(replayer, replay_started)
+      frame = replayer.next_frame()
+      if frame is None:
+        finish_replay(replayer, replay_started)
+      events, tick = frame
+    try:
+      with profiler.time_phase('events'):
+        for event in events:
+          if event.type == pygame.QUIT:
+            score_writer.flush()
+            sys.exit()
+          elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+              score_writer.flush()
+              sys.exit()
+            elif event.key == pygame.K_F3:
+              profiler.toggle_overlay()
+            else:
+              game.handle_key(event.key)
+          elif event.type >= pygame.USEREVENT:
+            robot.handle_event_type(event.type)
+
+      drawn_state = render_frame(drawn_state, tick,
+                                 draw=not (replayer and args.no_draw))
+      profiler.end_frame()
+      if first_frame:
+        first_frame = False
+        print('Startup: first frame after %s ms' % int(
+          (time.time() - startup_time) * 1000))
+        resources.stop_watching_imports()
+        if args.profile_startup:
+          print(resources.report())
+      if not prefetched:
+        # Load what is left a little at a time, so no frame runs long.
+        prefetched = resources.prefetch(budget_ms=PREFETCH_BUDGET_MS)
+        if prefetched and args.profile_startup:
+          print('Startup: everything loaded after %s ms' % int(
+            (time.time() - startup_time) * 1000))
+          print(resources.report())
+    except Exception:
+      print(traceback.format_exc())
+      if replayer:
+        print('Replay frame %s' % replayer.position)
+      game.goto_error()
+    # Recorded even when the frame failed, so a replay fails the same way.
+    if recorder:
+      recorder.record(events, game.last_tick)
+
+    if IDLE_SLEEP and prefetched and not replayer:
+      # Nothing would change on screen until then, so sleep instead of
+      # drawing the same frames, unless input or a pour timer comes first.
+      idle_ms = game.next_change_ms()
+      # A timeout of 0 would wait for input forever.
+      if idle_ms is not None and int(idle_ms) > 0:
+        with profiler.time_phase('idle'):
+          event = pygame.event.wait(int(idle_ms))
+        if event.type != pygame.NOEVENT:
+          woken_by.append(event)
+
+if __name__ == '__main__':
+  main()
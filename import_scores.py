@@ -0,0 +1,23 @@
+# Imports scores.json files (and their journals) into the SQLite leaderboard.
+# Imported scores have no timestamp, so they never show up as today's.
+#
+# Usage: python import_scores.py [--db scores.db] scores.json [...]
+
+import argparse
+
+from scores import SqliteScoreStore, read_scores
+
+parser = argparse.ArgumentParser(
+  description='Import scores.json files into the SQLite leaderboard.')
+parser.add_argument('--db', default='scores.db',
+                    help='database to import into (default: %(default)s)')
+parser.add_argument('files', nargs='+', metavar='scores.json')
+args = parser.parse_args()
+
+db = SqliteScoreStore(args.db)
+for filename in args.files:
+  # Scores still sitting in the journals count too. The files are only read:
+  # loading them through ScoreStore would recover and compact them.
+  scores = read_scores(filename)
+  db.insert(scores)
+  print('Imported %s scores from %s' % (len(scores), filename))
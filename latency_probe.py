@@ -0,0 +1,169 @@
+# Measures how long it takes from a key press reaching the game to the hit
+# sound coming out of the speakers, for a range of mixer buffer sizes, so
+# MIXER_BUFFER in values.py can be set to the smallest one that doesn't
+# crackle on this hardware.
+#
+# Needs a microphone (or a loopback cable) that hears the cabinet's speakers.
+# For every buffer size it plays the hit sound after synthetic key presses
+# and times the onset in the recording, then plays a few seconds of steady
+# tone and counts the dropouts in it, which is what underruns sound like.
+#
+# Usage: python latency_probe.py [--buffers 256 512 1024 2048] [--trials 20]
+
+import argparse
+import array
+import math
+import random
+import threading
+import time
+
+import pygame
+from pygame._sdl2.audio import (AUDIO_S16, AudioDevice,
+                                get_audio_device_names)
+
+import audio
+from audio import SoundEffects
+
+FREQUENCY = 44100
+CAPTURE_CHUNK = 256
+ONSET_LEVEL = 4000
+
+parser = argparse.ArgumentParser(
+  description='Measure key-to-sound latency per mixer buffer size.')
+parser.add_argument('--buffers', type=int, nargs='+',
+                    default=[256, 512, 1024, 2048])
+parser.add_argument('--trials', type=int, default=20)
+parser.add_argument('--tone-secs', type=float, default=3)
+parser.add_argument('--device', help='capture device name (default: first)')
+args = parser.parse_args()
+
+class Listener(object):
+  """Timestamps sound onsets and keeps chunk levels from a capture device."""
+  def __init__(self, device):
+    self.lock = threading.Lock()
+    self.armed_at = None
+    self.onset = None
+    self.levels = []
+    self.recording_levels = False
+    self.device = AudioDevice(
+      devicename=device, iscapture=True, frequency=FREQUENCY,
+      audioformat=AUDIO_S16, numchannels=1, chunksize=CAPTURE_CHUNK,
+      allowed_changes=0, callback=self.callback)
+    self.device.pause(0)
+
+  def callback(self, device, data):
+    now = time.perf_counter()
+    samples = array.array('h', bytes(data))
+    with self.lock:
+      if self.recording_levels:
+        self.levels.append(max(abs(s) for s in samples))
+      if self.armed_at is not None and self.onset is None:
+        for i, s in enumerate(samples):
+          if abs(s) > ONSET_LEVEL:
+            # The chunk ended at now, so sample i was heard a little before.
+            self.onset = now - (len(samples) - i) / FREQUENCY
+            break
+
+  def arm(self):
+    with self.lock:
+      self.onset = None
+      self.armed_at = time.perf_counter()
+
+  def wait_for_onset(self, timeout=1.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+      with self.lock:
+        if self.onset is not None:
+          self.armed_at = None
+          return self.onset
+      time.sleep(0.001)
+    with self.lock:
+      self.armed_at = None
+    return None
+
+  def close(self):
+    self.device.close()
+
+def make_tone(secs):
+  samples = array.array('h')
+  for i in range(int(FREQUENCY * secs)):
+    value = int(12000 * math.sin(2 * math.pi * 440 * i / FREQUENCY))
+    samples.extend((value, value))
+  return pygame.mixer.Sound(buffer=samples.tobytes())
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+def probe(buffer_size, listener):
+  pygame.mixer.quit()
+  pygame.mixer.init(FREQUENCY, -16, 2, buffer_size)
+  audio.reserved_channels = 0
+  sfx = SoundEffects({'hit': (4, 'oldest')})
+  hit = sfx.load('sound_fx/trolley-bell-1.wav', 'hit')
+
+  latencies = []
+  misses = 0
+  for _ in range(args.trials):
+    # Let the last bell ring out, at uneven intervals so the onset can't
+    # line up with the buffers by chance.
+    pygame.time.wait(random.randint(1000, 1300))
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_1))
+    listener.arm()
+    pressed = None
+    # The same path as the game loop: pull the event, then play the sound.
+    for event in pygame.event.get():
+      if event.type == pygame.KEYDOWN:
+        pressed = time.perf_counter()
+        hit.play()
+    onset = listener.wait_for_onset()
+    if onset is None or pressed is None:
+      misses += 1
+    else:
+      latencies.append((onset - pressed) * 1000)
+  pygame.mixer.stop()
+
+  tone = make_tone(args.tone_secs)
+  pygame.time.wait(300)
+  with listener.lock:
+    listener.levels = []
+    listener.recording_levels = True
+  tone.play()
+  pygame.time.wait(int(args.tone_secs * 1000))
+  with listener.lock:
+    listener.recording_levels = False
+    # Skip the edges of the tone, only gaps in the middle count.
+    levels = listener.levels[10:-10]
+  dropouts = 0
+  if levels:
+    floor = percentile(levels, 0.5) * 0.2
+    dropouts = sum(1 for level in levels if level < floor)
+  return latencies, misses, dropouts
+
+pygame.init()
+pygame.display.set_mode((1, 1))
+devices = get_audio_device_names(True)
+if not devices:
+  raise SystemExit('No capture device found, plug in a microphone.')
+device = args.device or devices[0]
+print('Listening on %s' % device)
+listener = Listener(device)
+
+results = []
+for buffer_size in args.buffers:
+  latencies, misses, dropouts = probe(buffer_size, listener)
+  results.append((buffer_size, latencies, dropouts))
+  if latencies:
+    print('buffer %5s: median %6.1f ms, p95 %6.1f ms, %s missed, '
+          '%s dropouts' % (buffer_size, percentile(latencies, 0.5),
+                           percentile(latencies, 0.95), misses, dropouts))
+  else:
+    print('buffer %5s: no onsets heard, is the microphone near the '
+          'speakers?' % buffer_size)
+listener.close()
+
+clean = [buffer_size for buffer_size, latencies, dropouts in results
+         if latencies and not dropouts]
+if clean:
+  print('Smallest buffer without dropouts: %s (set MIXER_BUFFER in '
+        'values.py)' % min(clean))
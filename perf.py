@@ -0,0 +1,168 @@
+from collections import deque
+from contextlib import contextmanager
+import json
+import platform
+import subprocess
+import time
+
+import pygame
+
+class RollingTimes(object):
+  """The last window timings of something, in ms."""
+  def __init__(self, window):
+    self.times = deque(maxlen=window)
+
+  def add(self, ms):
+    self.times.append(ms)
+
+  def summary(self):
+    times = sorted(self.times)
+    if not times:
+      return None
+    return {
+      'n': len(times),
+      'p50': round(percentile(times, 0.5), 2),
+      'p95': round(percentile(times, 0.95), 2),
+      'max': round(times[-1], 2),
+    }
+
+class FrameProfiler(object):
+  """Times each phase of every frame and keeps rolling p50/p95/max of them.
+
+  Phases are timed with time_phase(); passing the current display times the
+  phase for its class as well, as 'phase:ClassName'. Every dump_secs the
+  summaries are appended to dump_path as a line of JSON, along with the
+  board and build they were taken on, through writer so the render thread
+  never waits on the SD card. The overlay shows the same numbers on screen.
+  counters maps names to functions returning a dict of counts, which are
+  dumped and shown along with the timings.
+  """
+  def __init__(self, window=300, dump_path=None, dump_secs=60, writer=None):
+    self.window = window
+    self.dump_path = dump_path
+    self.dump_secs = dump_secs
+    self.writer = writer
+    self.times = {}
+    self.counters = {}
+    self.frames = 0
+    self.frame_start = None
+    self.last_dump = time.time()
+    self.show_overlay = False
+    self.overlay = None
+    self.overlay_drawn_at = 0
+    self.overlay_rect = None
+    self.font = None
+    self.board = board_model()
+    self.build = build_id()
+
+  def add(self, name, ms):
+    if name not in self.times:
+      self.times[name] = RollingTimes(self.window)
+    self.times[name].add(ms)
+
+  @contextmanager
+  def time_phase(self, phase, display=None):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      ms = (time.perf_counter() - start) * 1000
+      self.add(phase, ms)
+      if display is not None:
+        self.add('%s:%s' % (phase, type(display).__name__), ms)
+
+  def start_frame(self):
+    self.frame_start = time.perf_counter()
+
+  def end_frame(self):
+    if self.frame_start is not None:
+      self.add('frame', (time.perf_counter() - self.frame_start) * 1000)
+    self.frames += 1
+    if self.dump_path and time.time() - self.last_dump >= self.dump_secs:
+      self.last_dump = time.time()
+      self.dump()
+
+  def summary(self):
+    return dict((name, times.summary()) for name, times in self.times.items())
+
+  def dump(self):
+    line = json.dumps({
+      'time': time.time(),
+      'board': self.board,
+      'build': self.build,
+      'frames': self.frames,
+      'phases': self.summary(),
+      'counters': self.counter_values(),
+    }, sort_keys=True)
+    if self.writer:
+      self.writer.submit(append_line, self.dump_path, line)
+    else:
+      append_line(self.dump_path, line)
+
+  def counter_values(self):
+    return dict((name, counts()) for name, counts in self.counters.items())
+
+  def toggle_overlay(self):
+    self.show_overlay = not self.show_overlay
+
+  def draw_overlay(self, surface):
+    """Draws the timings in the top left corner and returns where it drew.
+
+    On the frame after it is turned off it returns where it last drew, which
+    needs pushing to the display again to clear it.
+    """
+    if not self.show_overlay:
+      rect, self.overlay_rect = self.overlay_rect, None
+      return rect
+    # Rendering a dozen lines of fresh text costs a frame of its own, so only
+    # redo it a couple of times a second.
+    now = time.time()
+    if self.overlay is None or now - self.overlay_drawn_at > 0.5:
+      self.overlay = self.render_overlay()
+      self.overlay_drawn_at = now
+    self.overlay_rect = surface.blit(self.overlay, (0, 0))
+    return self.overlay_rect
+
+  def render_overlay(self):
+    if self.font is None:
+      self.font = pygame.font.Font('DejaVuSansMono.ttf', 12)
+    lines = ['%-32s %6s %6s %6s' % ('ms', 'p50', 'p95', 'max')]
+    for name, summary in sorted(self.summary().items()):
+      if summary:
+        lines.append('%-32s %6.1f %6.1f %6.1f' % (
+          name[:32], summary['p50'], summary['p95'], summary['max']))
+    for name, counts in sorted(self.counter_values().items()):
+      lines.append('%s: %s' % (name, ', '.join(
+        '%s %s' % item for item in sorted(counts.items()))))
+    line_height = self.font.get_linesize()
+    overlay = pygame.Surface(
+      (max(self.font.size(line)[0] for line in lines) + 8,
+       line_height * len(lines) + 8))
+    overlay.set_alpha(200)
+    for i, line in enumerate(lines):
+      overlay.blit(self.font.render(line, False, (0, 255, 0)),
+                   (4, 4 + i * line_height))
+    return overlay
+
+def percentile(times, p):
+  return times[min(len(times) - 1, int(len(times) * p))]
+
+def append_line(path, line):
+  with open(path, 'a') as f:
+    f.write(line + '\n')
+
+def board_model():
+  """The Raspberry Pi model, or the machine type anywhere else."""
+  try:
+    with open('/proc/device-tree/model') as f:
+      return f.read().strip('\0\n')
+  except IOError:
+    return platform.machine()
+
+def build_id():
+  try:
+    return subprocess.check_output(
+      ['git', 'describe', '--always', '--dirty'],
+      stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unknown'
@@ -1,24 +1,124 @@
+# Primes the lines, so the first drinks of the night pour full measures.
+#
+# Every line runs for as long as it needs: --secs by default, or long enough
+# to pour the line's prime_ml from calibration.json at its measured flow
+# rate. Lines run in parallel, longest first, with no more than --max-on
+# switches on at once and --stagger-ms between switching them on. A
+# timeline of every switch is printed as it happens.
+#
+# Usage: python prime.py [--tiers 0 2] [--pins 5] [--secs 30]
+#                        [--max-on 4] [--stagger-ms 250] [--sim]
+
+import argparse
 import time
 
-from gpiozero import LED
+from values import (MAX_CONCURRENT_SWITCHES, TIER_TO_PINS,
+                    load_calibration)
+
+class WallClock(object):
+  def __init__(self):
+    self.start = time.monotonic()
+
+  def now(self):
+    return time.monotonic() - self.start
+
+  def sleep(self, secs):
+    time.sleep(secs)
+
+class FastClock(object):
+  """Lets a dry run go by instantly."""
+  def __init__(self):
+    self.t = 0.0
+
+  def now(self):
+    return self.t
+
+  def sleep(self, secs):
+    self.t += secs
+
+def prime_secs(pin, default_secs, calibration):
+  """How long pin's line needs to run, and why."""
+  prime_ml = calibration.get('prime_ml', {}).get(str(pin))
+  ml_per_sec = calibration.get('ml_per_sec', {}).get(str(pin))
+  if prime_ml and ml_per_sec:
+    return prime_ml / ml_per_sec, '%s ml at %s ml/s' % (prime_ml, ml_per_sec)
+  return default_secs, 'default'
 
-tier_to_switch = {
-  0: (LED(0), LED(5)),
-  1: (LED(6), LED(13)),
-  2: (LED(19),),
-}
+def prime(lines, led, clock, max_on, stagger_secs):
+  """Runs each (pin, secs) line once, within max_on and the stagger."""
+  # Longest first, so the long lines aren't left running on their own at
+  # the end.
+  waiting = sorted(lines, key=lambda line: -line[1])
+  running = {}
+  switches = {}
+  last_on = None
+  while waiting or running:
+    now = clock.now()
+    for pin, off_at in list(running.items()):
+      if off_at <= now:
+        switches[pin].off()
+        del running[pin]
+        print('%7.2f s  pin %2s off' % (now, pin))
+    while (waiting and len(running) < max_on and
+           (last_on is None or now - last_on >= stagger_secs)):
+      pin, secs = waiting.pop(0)
+      switches[pin] = switches.get(pin) or led(pin)
+      switches[pin].on()
+      running[pin] = now + secs
+      last_on = now
+      print('%7.2f s  pin %2s on for %.1f s' % (now, pin, secs))
+    due = list(running.values())
+    if waiting and len(running) < max_on:
+      due.append(last_on + stagger_secs)
+    if due:
+      clock.sleep(max(min(due) - clock.now(), 0))
+  return clock.now()
 
-print('Writing high to pins, turning them on')
-for idx, switches in tier_to_switch.items():
-  for switch in switches:
-    switch.on()
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Prime the drink lines.')
+  parser.add_argument('--tiers', type=int, nargs='+',
+                      help='only prime the lines of these tiers')
+  parser.add_argument('--pins', type=int, nargs='+',
+                      help='only prime these pins, e.g. after a bottle change')
+  parser.add_argument('--secs', type=float, default=30,
+                      help='how long to run lines without a calibrated '
+                           'prime_ml')
+  parser.add_argument('--max-on', type=int, default=MAX_CONCURRENT_SWITCHES,
+                      help='most switches on at once')
+  parser.add_argument('--stagger-ms', type=int, default=250,
+                      help='gap between switching lines on')
+  parser.add_argument('--sim', action='store_true',
+                      help='dry run on simulated pins, without waiting')
+  args = parser.parse_args()
 
-sleep = 30
-print('Sleeping for %s seconds' % sleep)
-time.sleep(sleep)
+  calibration = {
+    'ml_per_sec': load_calibration('ml_per_sec'),
+    'prime_ml': load_calibration('prime_ml'),
+  }
+  lines = []
+  for tier, pins in sorted(TIER_TO_PINS.items()):
+    if args.tiers is not None and tier not in args.tiers:
+      continue
+    for pin in pins:
+      if args.pins is not None and pin not in args.pins:
+        continue
+      secs, why = prime_secs(pin, args.secs, calibration)
+      print('Tier %s, pin %2s: %.1f s (%s)' % (tier, pin, secs, why))
+      lines.append((pin, secs))
+  if not lines:
+    raise SystemExit('No lines selected')
 
-print('Writing low to pins, turning them off')
-for idx, switches in tier_to_switch.items():
-  for switch in switches:
-    switch.off()
+  if args.sim:
+    from simgpio import SimBoard
+    clock = FastClock()
+    board = SimBoard(now=clock.now)
+    led = board.LED
+  else:
+    from gpiozero import LED as led
+    clock = WallClock()
 
+  took = prime(lines, led, clock, args.max_on, args.stagger_ms / 1000)
+  if args.sim:
+    board.assert_max_on(args.max_on)
+  print('Primed %s lines in %.1f s (one at a time: %.1f s)' % (
+    len(lines), took, sum(secs for _, secs in lines)))
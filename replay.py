@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+
+import pygame
+
+from perf import build_id
+from scores import ScoreStore, SqliteScoreStore, write_atomically
+
+VERSION = 1
+
+def encode_event(event):
+  """The parts of an event the game acts on, or None if it ignores it."""
+  if event.type == pygame.KEYDOWN:
+    return [event.type, event.key]
+  elif event.type == pygame.QUIT or event.type >= pygame.USEREVENT:
+    return [event.type]
+  return None
+
+def decode_event(data):
+  if data[0] == pygame.KEYDOWN:
+    return pygame.event.Event(data[0], key=data[1])
+  return pygame.event.Event(data[0])
+
+class Recorder(object):
+  """Writes the events and tick of every frame to a file, to replay later.
+
+  The displays only ever move on through their ticks and key presses, so
+  these reproduce a whole session. The file starts with a header line that
+  has the leaderboard as it was, then has one line of JSON per frame. Lines
+  are handed to writer in batches of flush_every frames.
+  """
+  def __init__(self, path, scores, backend, writer, flush_every=30):
+    self.path = path
+    self.writer = writer
+    self.flush_every = flush_every
+    self.pending = []
+    header = {
+      'version': VERSION,
+      'build': build_id(),
+      'backend': backend,
+      'scores': scores,
+    }
+    with open(path, 'w') as f:
+      f.write(json.dumps(header) + '\n')
+
+  def record(self, events, tick):
+    events = [e for e in map(encode_event, events) if e is not None]
+    self.pending.append(json.dumps({'tick': tick, 'events': events}))
+    if len(self.pending) >= self.flush_every:
+      self.flush()
+
+  def flush(self):
+    if self.pending:
+      self.writer.submit(append_lines, self.path, self.pending)
+      self.pending = []
+
+class Replayer(object):
+  """Plays back the frames of a recording one at a time."""
+  def __init__(self, path):
+    with open(path) as f:
+      lines = f.readlines()
+    self.header = json.loads(lines[0])
+    if self.header['version'] != VERSION:
+      raise ValueError('Recording %s is version %s, expected %s' % (
+        path, self.header['version'], VERSION))
+    self.frames = []
+    for line in lines[1:]:
+      try:
+        self.frames.append(json.loads(line))
+      except ValueError:
+        # The last line of a recording cut short by a crash.
+        break
+    self.position = 0
+
+  def next_frame(self):
+    """The events and tick of the next frame, or None at the end."""
+    if self.position >= len(self.frames):
+      return None
+    frame = self.frames[self.position]
+    self.position += 1
+    return [decode_event(e) for e in frame['events']], frame['tick']
+
+  def game_time_ms(self):
+    return sum(frame['tick'] for frame in self.frames[:self.position])
+
+  def score_store(self, writer):
+    """A throwaway score store holding the leaderboard of the recording."""
+    tmp_dir = tempfile.mkdtemp(prefix='whiskey-replay-')
+    if self.header['backend'] == 'sqlite':
+      store = SqliteScoreStore(os.path.join(tmp_dir, 'scores.db'),
+                               writer=writer)
+      store.insert(self.header['scores'])
+      return store
+    path = os.path.join(tmp_dir, 'scores.json')
+    write_atomically(path, self.header['scores'])
+    return ScoreStore(path, writer=writer)
+
+def append_lines(path, lines):
+  with open(path, 'a') as f:
+    f.write(''.join(line + '\n' for line in lines))
@@ -0,0 +1,129 @@
+import sys
+import time
+
+class Resources(object):
+  """Loads the game's assets the first time they are used.
+
+  Each asset is registered under a name with a function that loads it and
+  a priority. get() loads it on first use. prefetch() loads whatever is
+  still missing, lowest priority first, for as long as it is given, so the
+  main loop can fill its idle time with it. Everything stays on the thread
+  that drew the first frame, which keeps SDL happy.
+
+  How long every load took is kept for the startup profile, along with the
+  module imports while watch_imports() is on.
+  """
+  def __init__(self, clock=time.perf_counter):
+    self.clock = clock
+    self.started = clock()
+    self.loaders = {}
+    self.priorities = {}
+    self.loaded = {}
+    # (started at ms, took ms, what, depth) for every load and import.
+    self.timings = []
+    self.import_timer = None
+
+  def register(self, name, load, priority=50):
+    self.loaders[name] = load
+    self.priorities[name] = priority
+
+  def get(self, name):
+    if name not in self.loaded:
+      self.loaded[name] = self.timed(name, self.loaders[name])
+    return self.loaded[name]
+
+  def load(self, name, load, priority=0):
+    """Registers and loads an asset that is needed straight away."""
+    self.register(name, load, priority)
+    return self.get(name)
+
+  def pending(self):
+    names = [name for name in self.loaders if name not in self.loaded]
+    return sorted(names, key=lambda name: self.priorities[name])
+
+  def prefetch(self, budget_ms=None):
+    """Loads pending assets until budget_ms is up. True once all are in."""
+    start = self.clock()
+    for name in self.pending():
+      if (budget_ms is not None and
+          (self.clock() - start) * 1000 >= budget_ms):
+        return False
+      self.get(name)
+    return True
+
+  def timed(self, what, fn, depth=0):
+    start = self.clock()
+    try:
+      return fn()
+    finally:
+      self.timings.append(((start - self.started) * 1000,
+                           (self.clock() - start) * 1000, what, depth))
+
+  def watch_imports(self):
+    """Times every module imported from now until stop_watching_imports()."""
+    if self.import_timer is None:
+      self.import_timer = ImportTimer(self)
+      sys.meta_path.insert(0, self.import_timer)
+
+  def stop_watching_imports(self):
+    if self.import_timer is not None:
+      sys.meta_path.remove(self.import_timer)
+      self.import_timer = None
+
+  def report(self, min_ms=0.5):
+    """Every import and load that took at least min_ms, in order."""
+    lines = ['%8s %8s' % ('at ms', 'took ms')]
+    for at, took, what, depth in sorted(self.timings):
+      if took >= min_ms:
+        lines.append('%8.1f %8.1f  %s%s' % (at, took, '  ' * depth, what))
+    pending = self.pending()
+    if pending:
+      lines.append('Not loaded yet: %s' % ', '.join(pending))
+    return '\n'.join(lines)
+
+class ImportTimer(object):
+  """Finds modules like the rest of sys.meta_path, timing their imports.
+
+  The time of a module includes the modules it imports itself, which show
+  up under it.
+  """
+  def __init__(self, resources):
+    self.resources = resources
+    self.depth = 0
+
+  def find_spec(self, fullname, path, target=None):
+    for finder in sys.meta_path:
+      find = getattr(finder, 'find_spec', None)
+      if finder is self or find is None:
+        continue
+      spec = find(fullname, path, target)
+      if spec is not None:
+        break
+    else:
+      return None
+    if getattr(spec.loader, 'exec_module', None) is not None:
+      spec.loader = TimedLoader(spec.loader, self)
+    return spec
+
+class TimedLoader(object):
+  def __init__(self, loader, timer):
+    self.loader = loader
+    self.timer = timer
+
+  def create_module(self, spec):
+    return self.loader.create_module(spec)
+
+  def exec_module(self, module):
+    timer = self.timer
+    timer.depth += 1
+    try:
+      timer.resources.timed('import %s' % module.__name__,
+                            lambda: self.loader.exec_module(module),
+                            timer.depth - 1)
+    finally:
+      timer.depth -= 1
+
+  def __getattr__(self, attr):
+    return getattr(self.loader, attr)
+
+resources = Resources()
@@ -1,8 +1,44 @@
+from collections import deque
+import time
+import weakref
+
 import pygame
 
 from values import *
 
+class Pour(object):
+  """One drink, from when it was asked for until it finished pouring."""
+  def __init__(self, tier, drink, requested_at):
+    self.tier = tier
+    self.drink = drink
+    self.requested_at = requested_at
+    self.started_at = None
+    self.finished_at = None
+    self.pour_time_ms = None
+    # The lines of the tier that are still running, and when (in ms into
+    # the pour) each line is due to turn off, soonest first.
+    self.lines_on = set()
+    self.line_offs = []
+
+  def remaining_ms(self, now):
+    if self.started_at is None:
+      return self.pour_time_ms
+    elapsed = (now - self.started_at) * 1000
+    return max(self.pour_time_ms - elapsed, 0)
+
 class BaseRobot(object):
+  """Pours drinks, several tiers at a time.
+
+  Every tier has its own switches and its own pour timer, so different
+  tiers can pour at once as long as no more than max_switches switches are
+  on in total, which is what the power supply can drive. Drinks that can't
+  start yet wait in a queue and start in the order they were asked for as
+  tiers and power free up. Listeners are called with ('start', pour) and
+  ('finish', pour) as soon as the pour timer events are handled.
+
+  Timers are set with set_timer and time is read from now, pygame's and the
+  wall clock's unless a simulation passes in its own.
+  """
   TIER_TO_EVENT = {
     0: pygame.USEREVENT,
     1: pygame.USEREVENT + 1,
@@ -11,52 +47,187 @@ class BaseRobot(object):
   EVENT_TO_TIER = dict((value, key) for key, value in TIER_TO_EVENT.items())
   LIGHT_EVENT = pygame.USEREVENT + 3
 
-  def __init__(self):
+  def __init__(self, max_switches=MAX_CONCURRENT_SWITCHES,
+               set_timer=pygame.time.set_timer, now=time.time,
+               calibration=None):
+    self.set_timer = set_timer
+    self.now = now
+    if calibration is None:
+      calibration = load_calibration()
+    self.calibration = calibration
     self.tier_to_drink = dict((i, drink) for i, drink in enumerate(drinks))
-    self.pouring_tier = None
+    self.max_switches = max_switches
+    # The pour on each tier that is pouring right now.
+    self.pouring = {}
+    self.queue = deque()
+    self.listeners = []
+    # When each pour of the last hour finished.
+    self.finished = deque()
+
+  def add_listener(self, listener, weak=False):
+    """Calls listener on every start and finish.
+
+    With weak, listener is a bound method that is only held on to for as
+    long as its object is around, so displays can listen without being
+    kept alive by the robot.
+    """
+    if weak:
+      listener = weakref.WeakMethod(listener)
+    self.listeners.append((listener, weak))
+
+  def notify(self, what, pour):
+    for entry in list(self.listeners):
+      listener, weak = entry
+      if weak:
+        listener = listener()
+        if listener is None:
+          self.listeners.remove(entry)
+          continue
+      listener(what, pour)
+
+  def is_pouring_drink(self, tier=None):
+    """Whether any drink, or one for tier, is pouring or waiting to."""
+    if tier is None:
+      return bool(self.pouring or self.queue)
+    return tier in self.pouring or any(p.tier == tier for p in self.queue)
+
+  def switch_count(self, tier):
+    return len(TIER_TO_PINS[tier])
+
+  def switches_on(self):
+    return sum(len(pour.lines_on) for pour in self.pouring.values())
+
+  def line_times_ms(self, tier):
+    """How long each line of tier has to run to pour its part of the drink.
+
+    Lines with a measured flow rate run for exactly their volume of the
+    recipe; the others fall back to sharing BASE_POUR_TIME_MS.
+    """
+    pins = TIER_TO_PINS[tier]
+    times = []
+    for i, pin in enumerate(pins):
+      ml_per_sec = self.calibration.get(str(pin))
+      if recipes and ml_per_sec:
+        # At least 1 ms: a timer of 0 ms would be cancelled, not armed.
+        times.append(max(int(recipes[tier][i] / ml_per_sec * 1000), 1))
+      else:
+        times.append(BASE_POUR_TIME_MS // len(pins))
+    return times
 
-  def is_pouring_drink(self):
-    return self.pouring_tier != None
+  def pour_time_ms(self, tier):
+    return max(self.line_times_ms(tier))
+
+  def time_until_free_ms(self, tier):
+    """Roughly how long until tier has poured everything asked of it."""
+    pours = [p for p in self.queue if p.tier == tier]
+    if tier in self.pouring:
+      pours.append(self.pouring[tier])
+    now = self.now()
+    return sum(p.remaining_ms(now) for p in pours)
 
   def pour_drink(self, tier):
-    if self.is_pouring_drink():
-      raise ValueError('Refusing to pour drink while drink is already pouring')
-
-    self.pouring_tier = tier
-    drink = self.tier_to_drink[tier]
-    print('Pouring %s' % drink)
-    event = self.TIER_TO_EVENT[tier]
-    pour_time = BASE_POUR_TIME_MS // 2
-    if hasattr(self, 'tier_to_switch'):
-      pour_time = BASE_POUR_TIME_MS // len(self.tier_to_switch[tier])
-    pygame.time.set_timer(event, pour_time)
+    """Pours a drink from tier as soon as the tier and power allow."""
+    pour = Pour(tier, self.tier_to_drink[tier], self.now())
+    pour.pour_time_ms = self.pour_time_ms(tier)
+    self.queue.append(pour)
+    self.start_queued()
+    if pour.started_at is None:
+      print('Queued %s' % pour.drink)
+    return pour
+
+  def can_start(self, tier):
+    if tier in self.pouring:
+      return False
+    # A tier with more switches than the budget may still pour on its own.
+    return (not self.pouring or
+            self.switches_on() + self.switch_count(tier) <= self.max_switches)
+
+  def start_queued(self):
+    for pour in list(self.queue):
+      if pour.tier in self.pouring:
+        # Another drink from the same tier; later tiers can go ahead.
+        continue
+      if not self.can_start(pour.tier):
+        # Out of power: wait rather than let smaller pours jump the queue
+        # forever.
+        break
+      self.queue.remove(pour)
+      self.start_pour(pour)
+
+  def start_pour(self, pour):
+    pour.started_at = self.now()
+    times = self.line_times_ms(pour.tier)
+    pour.lines_on = set(range(len(times)))
+    pour.line_offs = sorted((ms, i) for i, ms in enumerate(times))
+    self.pouring[pour.tier] = pour
+    print('Pouring %s' % pour.drink)
+    for i in pour.lines_on:
+      self.line_on(pour.tier, i)
+    # The tier's timer goes off every time one of its lines is due to stop.
+    self.set_timer(self.TIER_TO_EVENT[pour.tier],
+                   max(pour.line_offs[0][0], 1))
+    self.notify('start', pour)
+
+  def line_on(self, tier, line):
+    pass
+
+  def line_off(self, tier, line):
+    pass
 
   def handle_event_type(self, event_type):
-    pygame.time.set_timer(event_type, 0)
+    self.set_timer(event_type, 0)
     if event_type == self.LIGHT_EVENT:
       return
-    if self.EVENT_TO_TIER[event_type] != self.pouring_tier:
-      raise ValueError('Got back pour END event that did not match currently '
-                       'pouring drink')
-    print('Done pouring %s' % self.tier_to_drink[self.pouring_tier])
-    self.pouring_tier = None
-    pygame.time.set_timer(self.LIGHT_EVENT, LIGHT_TIME_MS)
+    tier = self.EVENT_TO_TIER[event_type]
+    pour = self.pouring.get(tier)
+    if pour is None:
+      raise ValueError('Got back pour END event for tier %s, which is not '
+                       'pouring' % tier)
+    due = pour.line_offs[0][0]
+    while pour.line_offs and pour.line_offs[0][0] == due:
+      _, line = pour.line_offs.pop(0)
+      pour.lines_on.discard(line)
+      self.line_off(tier, line)
+    if pour.line_offs:
+      self.set_timer(event_type, max(pour.line_offs[0][0] - due, 1))
+      # The power that line used can go to a drink that is waiting.
+      self.start_queued()
+      return
+
+    del self.pouring[tier]
+    pour.finished_at = self.now()
+    print('Done pouring %s' % pour.drink)
+    self.finished.append(pour.finished_at)
+    while self.finished[0] < pour.finished_at - 3600:
+      self.finished.popleft()
+    self.set_timer(self.LIGHT_EVENT, LIGHT_TIME_MS)
+    self.notify('finish', pour)
+    self.start_queued()
+
+  def pours_per_hour(self):
+    """How many drinks finished pouring in the last hour."""
+    while self.finished and self.finished[0] < self.now() - 3600:
+      self.finished.popleft()
+    return len(self.finished)
 
 class Robot(BaseRobot):
-  def __init__(self):
-    super().__init__()
-    self.tier_to_switch = {
-      0: (LED(0), LED(5)),
-      1: (LED(6), LED(13)),
-      2: (LED(19),),
-    }
-    self.light_switch = LED(26)
+  """Drives the pour and light switches on the Pi's GPIO pins.
 
-  def pour_drink(self, tier):
-    super().pour_drink(tier)
-    switches = self.tier_to_switch[tier]
-    for switch in switches:
-      switch.on()
+  led makes a switch for a pin number, gpiozero's LED by default.
+  """
+  def __init__(self, led=None, **kwargs):
+    super().__init__(**kwargs)
+    led = led or LED
+    self.tier_to_switch = dict(
+      (tier, tuple(led(pin) for pin in pins))
+      for tier, pins in TIER_TO_PINS.items())
+    self.light_switch = led(LIGHT_PIN)
+
+  def line_on(self, tier, line):
+    self.tier_to_switch[tier][line].on()
+
+  def line_off(self, tier, line):
+    self.tier_to_switch[tier][line].off()
 
   def handle_event_type(self, event_type):
     if event_type == self.LIGHT_EVENT:
@@ -64,16 +235,20 @@ class Robot(BaseRobot):
       super().handle_event_type(event_type)
       return
     else:
-      switches = self.tier_to_switch[self.pouring_tier]
-      for switch in switches:
-        switch.off()
-      self.light_switch.on()
+      tier = self.EVENT_TO_TIER[event_type]
+      pour = self.pouring.get(tier)
       super().handle_event_type(event_type)
+      if pour and pour.finished_at is not None:
+        self.light_switch.on()
 
 # If we have the gpiozero library, we're on the Pi so use the real robot.
-# Otherwise use the base/fake robot.
+# Otherwise use the base/fake robot, or the real one on simulated pins.
 try:
   from gpiozero import LED
   robot = Robot()
 except ImportError:
-  robot = BaseRobot()
+  if USE_SIMULATED_GPIO:
+    from simgpio import SimBoard
+    robot = Robot(led=SimBoard(log=True).LED)
+  else:
+    robot = BaseRobot()
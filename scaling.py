@@ -0,0 +1,129 @@
+import os
+from collections import OrderedDict
+
+import pygame
+
+class ScaledScreen(object):
+  """The game's fixed-size screen, presented on a panel of any size.
+
+  The game draws into surface, which is always size. present() puts it on
+  the display in one scaling step:
+
+  - 'sdl' opens the display at size with pygame's SCALED flag, so SDL's
+    renderer scales it to the panel on the GPU. smooth picks linear rather
+    than nearest filtering.
+  - 'software' opens the display at the panel's resolution and scales into
+    it with pygame.transform: by the largest whole factor that fits unless
+    smooth, else as large as fits with smoothscale. Scaled copies of frames
+    a display marks as static with a key are cached, so e.g. the title
+    animation is only ever scaled once per frame.
+
+  'sdl' falls back to 'software' where SDL has no renderer to scale with.
+  Either way the picture keeps its aspect ratio, with black borders. When the
+  panel is size already the display is drawn into directly. window_size
+  opens a window of that size rather than going fullscreen.
+
+  SDL's renderer always presents the whole picture, so partial_updates is
+  False in 'sdl' mode and callers should present whole frames.
+  """
+  def __init__(self, size, mode='sdl', smooth=False, cache_frames=0,
+               window_size=None):
+    self.size = size
+    self.mode = mode
+    self.smooth = smooth
+    self.cache_frames = cache_frames
+    self.cache = OrderedDict()
+    self.hits = self.misses = 0
+    if mode not in ('sdl', 'software'):
+      raise ValueError('Unknown scaling mode %r' % mode)
+    flags = 0 if window_size else pygame.FULLSCREEN
+    if mode == 'sdl':
+      os.environ['SDL_RENDER_SCALE_QUALITY'] = 'linear' if smooth else 'nearest'
+      try:
+        self.window = pygame.display.set_mode(size, flags | pygame.SCALED)
+      except pygame.error as e:
+        # No renderer to scale with, e.g. on SDL's dummy video driver.
+        print('Scaling in software, SDL could not: %s' % e)
+        self.mode = mode = 'software'
+    if mode == 'software':
+      self.window = pygame.display.set_mode(window_size or (0, 0), flags)
+    # Only pygame's own window surface can push parts of itself.
+    self.partial_updates = mode == 'software'
+    self.target = self.fit(self.window.get_size())
+    if self.target.size == tuple(size):
+      self.surface = self.window
+      if self.target.topleft != (0, 0):
+        self.surface = self.window.subsurface(self.target)
+      self.scaled = None
+    else:
+      self.surface = pygame.Surface(size).convert(self.window)
+      self.scaled = self.window.subsurface(self.target)
+    self.window.fill((0, 0, 0))
+
+  def fit(self, panel):
+    """Where the picture goes on a panel of the given size."""
+    if self.mode == 'sdl':
+      return pygame.Rect((0, 0), panel)
+    scale = min(panel[0] / self.size[0], panel[1] / self.size[1])
+    if not self.smooth and scale >= 1:
+      scale = int(scale)
+    rect = pygame.Rect(0, 0, int(self.size[0] * scale),
+                       int(self.size[1] * scale))
+    rect.center = panel[0] // 2, panel[1] // 2
+    return rect
+
+  def scale_rect(self, rect):
+    """rect of surface, in the coordinates of the scaled picture."""
+    sx = self.target.width / self.size[0]
+    sy = self.target.height / self.size[1]
+    left, top = int(rect.left * sx), int(rect.top * sy)
+    return pygame.Rect(left, top, int(rect.right * sx + 0.999) - left,
+                       int(rect.bottom * sy + 0.999) - top)
+
+  def scale_into(self, source, dest):
+    if self.smooth:
+      pygame.transform.smoothscale(source, dest.get_size(), dest)
+    else:
+      pygame.transform.scale(source, dest.get_size(), dest)
+
+  def present(self, rects=None, key=None):
+    """Shows rects of surface, or all of it if None.
+
+    If key is given the whole surface is a static frame identified by key.
+    """
+    if self.scaled is None:
+      if rects is None:
+        pygame.display.flip()
+      else:
+        pygame.display.update([r.move(self.target.topleft) for r in rects])
+      return
+
+    if rects is None:
+      if key is not None and key in self.cache:
+        self.hits += 1
+        self.cache.move_to_end(key)
+        self.scaled.blit(self.cache[key], (0, 0))
+      else:
+        self.scale_into(self.surface, self.scaled)
+        if key is not None and self.cache_frames:
+          self.misses += 1
+          self.cache[key] = self.scaled.copy()
+          if len(self.cache) > self.cache_frames:
+            self.cache.popitem(last=False)
+      pygame.display.flip()
+      return
+
+    updated = []
+    for rect in rects:
+      rect = rect.clip(self.surface.get_rect())
+      if not rect:
+        continue
+      dest = self.scale_rect(rect).clip(self.scaled.get_rect())
+      self.scale_into(self.surface.subsurface(rect),
+                      self.scaled.subsurface(dest))
+      updated.append(dest.move(self.target.topleft))
+    pygame.display.update(updated)
+
+  def stats(self):
+    return {'entries': len(self.cache), 'hits': self.hits,
+            'misses': self.misses}
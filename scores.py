@@ -0,0 +1,294 @@
+import bisect
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+# Leaderboards the attract loop can show, with their captions.
+VIEW_TITLES = {
+  'all': None,
+  'top': 'Top %s of all time',
+  'today': "Today's top %s",
+  'initials': 'Best per initials',
+}
+
+class BackgroundWriter(object):
+  """Runs disk writes on a thread of their own, in the order submitted.
+
+  Writes to the Pi's SD card can take hundreds of milliseconds, so the
+  render thread only ever queues them. The queue is bounded: if the card
+  falls that far behind, submit() blocks rather than piling up scores in
+  memory that a power cut would lose.
+  """
+  def __init__(self, max_pending=64):
+    self.queue = queue.Queue(max_pending)
+    self.thread = threading.Thread(
+      target=self.run, name='score-writer', daemon=True)
+    self.thread.start()
+
+  def submit(self, fn, *args):
+    self.queue.put((fn, args))
+
+  def run(self):
+    while True:
+      fn, args = self.queue.get()
+      try:
+        fn(*args)
+      except Exception:
+        print(traceback.format_exc())
+      finally:
+        self.queue.task_done()
+
+  def flush(self):
+    """Blocks until every write submitted so far is on disk."""
+    self.queue.join()
+
+class ScoreStore(object):
+  """The high scores, kept in memory best first and persisted to disk.
+
+  The scores file stays a JSON list of [name, score] pairs. New scores are
+  appended to a journal next to it, one [name, score] per line, and fsynced.
+  Every compact_every scores the journal is folded back into the scores file
+  by writing a new file and atomically replacing the old one, so a power cut
+  never leaves a half written leaderboard. All of the file writes happen on
+  writer, in order, while reads are served from memory straight away.
+  """
+  compact_every = 20
+  views = ('all',)
+
+  def __init__(self, path='scores.json', writer=None):
+    self.path = path
+    self.journal_path = path + '.journal'
+    self.writer = writer or BackgroundWriter()
+    self.lock = threading.Lock()
+    self.scores = []
+    # The negated scores, in the same order, for bisecting.
+    self.keys = []
+    self.journal_entries = 0
+    self.load()
+
+  def load(self):
+    scores = []
+    if os.path.isfile(self.path):
+      scores = json.load(open(self.path))
+    # A journal rotated by a compaction that may not have finished. Its name
+    # carries how many scores the compacted file has, so if the file did get
+    # replaced the journal is already part of it.
+    rotated = sorted(glob.glob(self.journal_path + '.*'))
+    recovered = False
+    for path in rotated:
+      expected = int(path.rsplit('.', 1)[1])
+      if len(scores) < expected:
+        scores.extend(read_journal(path))
+        recovered = True
+    repair_journal(self.journal_path)
+    entries = read_journal(self.journal_path)
+    scores.extend(entries)
+
+    scores.sort(key=lambda entry: -entry[1])
+    self.scores = scores
+    self.keys = [-score for _, score in scores]
+    self.journal_entries = len(entries)
+    if recovered:
+      write_atomically(self.path, scores)
+      if os.path.isfile(self.journal_path):
+        os.remove(self.journal_path)
+      self.journal_entries = 0
+    for path in rotated:
+      os.remove(path)
+    if self.journal_entries >= self.compact_every:
+      self.start_compaction()
+
+  def all(self):
+    with self.lock:
+      return list(self.scores)
+
+  def leaderboard(self, view):
+    return self.all()
+
+  def rank(self, score):
+    """The 1-based position a new score would take on the leaderboard."""
+    # New scores go after the ones they tie with.
+    return bisect.bisect_right(self.keys, -score) + 1
+
+  def add(self, name, score):
+    with self.lock:
+      idx = bisect.bisect_right(self.keys, -score)
+      self.keys.insert(idx, -score)
+      self.scores.insert(idx, [name, score])
+      self.writer.submit(self.append_to_journal, [name, score])
+      self.journal_entries += 1
+      if self.journal_entries >= self.compact_every:
+        self.start_compaction()
+    return idx + 1
+
+  def append_to_journal(self, entry):
+    with open(self.journal_path, 'a') as f:
+      f.write(json.dumps(entry) + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+
+  def start_compaction(self):
+    # The snapshot is taken now, so it holds exactly the scores journaled by
+    # the writes queued before the compaction.
+    self.journal_entries = 0
+    self.writer.submit(self.compact, list(self.scores))
+
+  def compact(self, snapshot):
+    rotated = None
+    if os.path.isfile(self.journal_path):
+      rotated = '%s.%d' % (self.journal_path, len(snapshot))
+      os.replace(self.journal_path, rotated)
+    write_atomically(self.path, snapshot)
+    if rotated:
+      os.remove(rotated)
+
+class SqliteScoreStore(object):
+  """The high scores in an SQLite database, with the time they were set.
+
+  Indexes on score, day and initials let the attract loop ask for the top
+  scores, today's top scores or the best score of every set of initials
+  without loading the whole history into Python. Only the scores themselves
+  are kept in memory, so a new score's rank never waits on the database.
+  """
+  views = ('top', 'today', 'initials')
+  leaderboard_size = 10
+  top_size = 100
+
+  def __init__(self, path='scores.db', writer=None):
+    self.path = path
+    self.writer = writer or BackgroundWriter()
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    with self.db:
+      self.db.executescript('''
+        CREATE TABLE IF NOT EXISTS scores (
+          id INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          score INTEGER NOT NULL,
+          recorded_at REAL,
+          day TEXT
+        );
+        CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, id);
+        CREATE INDEX IF NOT EXISTS scores_by_day ON scores (day, score DESC);
+        CREATE INDEX IF NOT EXISTS scores_by_name ON scores (name, score DESC);
+      ''')
+    # The negated scores, best first, for bisecting.
+    self.keys = [-score for score, in self.db.execute(
+      'SELECT score FROM scores ORDER BY score DESC')]
+
+  def query(self, sql, *args):
+    with self.lock:
+      return [list(row) for row in self.db.execute(sql, args)]
+
+  def all(self):
+    return self.query('SELECT name, score FROM scores ORDER BY score DESC, id')
+
+  def top(self, n):
+    return self.query(
+      'SELECT name, score FROM scores ORDER BY score DESC, id LIMIT ?', n)
+
+  def today(self, n):
+    return self.query(
+      'SELECT name, score FROM scores WHERE day = ? '
+      'ORDER BY score DESC, id LIMIT ?', time.strftime('%Y-%m-%d'), n)
+
+  def best_per_initials(self, n):
+    return self.query(
+      'SELECT name, MAX(score) AS best FROM scores GROUP BY name '
+      'ORDER BY best DESC LIMIT ?', n)
+
+  def leaderboard(self, view):
+    if view == 'top':
+      return self.top(self.top_size)
+    elif view == 'today':
+      return self.today(self.leaderboard_size)
+    elif view == 'initials':
+      return self.best_per_initials(self.leaderboard_size)
+    return self.all()
+
+  def rank(self, score):
+    # New scores go after the ones they tie with.
+    return bisect.bisect_right(self.keys, -score) + 1
+
+  def add(self, name, score, recorded_at=None):
+    rank = self.rank(score)
+    self.keys.insert(rank - 1, -score)
+    if recorded_at is None:
+      recorded_at = time.time()
+    self.writer.submit(self.write, [[name, score]], recorded_at)
+    return rank
+
+  def insert(self, entries, recorded_at=None):
+    """Inserts [name, score] entries in order, in a single transaction."""
+    for _, score in entries:
+      bisect.insort_right(self.keys, -score)
+    self.write(entries, recorded_at)
+
+  def write(self, entries, recorded_at=None):
+    day = None
+    if recorded_at is not None:
+      day = time.strftime('%Y-%m-%d', time.localtime(recorded_at))
+    with self.lock, self.db:
+      self.db.executemany(
+        'INSERT INTO scores (name, score, recorded_at, day) '
+        'VALUES (?, ?, ?, ?)',
+        [(name, score, recorded_at, day) for name, score in entries])
+
+def read_journal(path):
+  entries = []
+  if not os.path.isfile(path):
+    return entries
+  for line in open(path):
+    try:
+      name, score = json.loads(line)
+    except ValueError:
+      continue
+    entries.append([name, score])
+  return entries
+
+def read_scores(path):
+  """Every score of a scores file and its journals, without touching them.
+
+  Picks up scores the way ScoreStore.load() recovers them, but never writes
+  or removes anything, so the files can be read while nothing runs them.
+  """
+  scores = []
+  if os.path.isfile(path):
+    scores = json.load(open(path))
+  for rotated in sorted(glob.glob(path + '.journal.*')):
+    if len(scores) < int(rotated.rsplit('.', 1)[1]):
+      scores.extend(read_journal(rotated))
+  scores.extend(read_journal(path + '.journal'))
+  scores.sort(key=lambda entry: -entry[1])
+  return scores
+
+def repair_journal(path):
+  """Drops a last line torn by a power cut mid-append.
+
+  Otherwise the next score would be appended to the end of it and both
+  would be lost.
+  """
+  if not os.path.isfile(path):
+    return
+  with open(path, 'rb+') as f:
+    data = f.read()
+    if data and not data.endswith(b'\n'):
+      f.truncate(data.rfind(b'\n') + 1)
+
+def write_atomically(path, scores):
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(scores, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+  dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+  try:
+    os.fsync(dir_fd)
+  finally:
+    os.close(dir_fd)
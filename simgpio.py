@@ -0,0 +1,235 @@
+# Simulated GPIO pins for running the robot anywhere, plus a simulation of a
+# night of pours on a virtual clock that checks the switches behaved.
+#
+# Usage: python simgpio.py [--hours 6] [--drinks-per-hour 40]
+#                          [--max-switches 4] [--seed 0]
+
+import argparse
+import heapq
+import random
+import time
+
+class VirtualClock(object):
+  """Stands in for the wall clock and pygame's timers in a simulation.
+
+  Time only moves when run() hands the next due timer event to a handler,
+  so hours of timers go by as fast as the handlers run. Timers repeat like
+  pygame's until they are set to 0.
+  """
+  def __init__(self, start=0.0):
+    self.start = start
+    self.now_ms = 0
+    self.timers = {}
+    self.due = []
+
+  def time(self):
+    return self.start + self.now_ms / 1000
+
+  def set_timer(self, event, ms):
+    if ms:
+      self.timers[event] = (self.now_ms + ms, ms)
+      heapq.heappush(self.due, (self.now_ms + ms, event))
+    else:
+      self.timers.pop(event, None)
+
+  def next_due(self):
+    # Drop entries for timers that were cancelled or set again since.
+    while self.due:
+      due, event = self.due[0]
+      if self.timers.get(event, (None,))[0] == due:
+        return due
+      heapq.heappop(self.due)
+    return None
+
+  def run(self, handler, until_ms=None):
+    """Fires timer events at handler in order, up to until_ms."""
+    while True:
+      due = self.next_due()
+      if due is None or (until_ms is not None and due > until_ms):
+        break
+      _, event = heapq.heappop(self.due)
+      self.now_ms = due
+      interval = self.timers[event][1]
+      self.timers[event] = (due + interval, interval)
+      heapq.heappush(self.due, (due + interval, event))
+      handler(event)
+    if until_ms is not None:
+      self.now_ms = max(self.now_ms, until_ms)
+
+class SimPin(object):
+  """A pin with the on()/off() of gpiozero's LED, that remembers its changes."""
+  def __init__(self, number, board):
+    self.number = number
+    self.board = board
+    self.is_lit = False
+
+  def on(self):
+    self.set(True)
+
+  def off(self):
+    self.set(False)
+
+  def set(self, value):
+    if value != self.is_lit:
+      self.is_lit = value
+      self.board.record(self.number, value)
+
+class SimBoard(object):
+  """Hands out simulated pins and keeps a timestamped log of every change."""
+  def __init__(self, now=time.time, log=False):
+    self.now = now
+    self.log = log
+    self.pins = {}
+    # (time, pin, on) for every change of any pin.
+    self.transitions = []
+
+  def LED(self, number):
+    if number in self.pins:
+      raise ValueError('Pin %s is already in use' % number)
+    self.pins[number] = SimPin(number, self)
+    return self.pins[number]
+
+  def record(self, number, value):
+    self.transitions.append((self.now(), number, value))
+    if self.log:
+      print('GPIO %s %s' % (number, 'on' if value else 'off'))
+
+  def intervals(self, number):
+    """The (on, off) times of a pin; off is None if it is still on."""
+    intervals = []
+    on_at = None
+    for at, pin, value in self.transitions:
+      if pin != number:
+        continue
+      if value:
+        on_at = at
+      else:
+        intervals.append((on_at, at))
+        on_at = None
+    if on_at is not None:
+      intervals.append((on_at, None))
+    return intervals
+
+  def max_on(self, pins=None):
+    """The most of pins (default: all of them) ever on at the same time."""
+    on = most = 0
+    for _, pin, value in self.transitions:
+      if pins is None or pin in pins:
+        on += 1 if value else -1
+        most = max(most, on)
+    return most
+
+  def assert_max_on(self, limit, pins=None):
+    most = self.max_on(pins)
+    assert most <= limit, '%s pins were on at once, limit is %s' % (
+      most, limit)
+
+  def assert_durations(self, pins, expected_ms, tolerance_ms=1):
+    """Every time pins went on they stayed on for expected_ms."""
+    for pin in pins:
+      for on_at, off_at in self.intervals(pin):
+        assert off_at is not None, 'Pin %s was left on' % pin
+        ms = (off_at - on_at) * 1000
+        assert abs(ms - expected_ms) <= tolerance_ms, (
+          'Pin %s was on for %d ms, expected %d ms' % (pin, ms, expected_ms))
+
+  def assert_light_follows(self, light_pin, pour_ends, light_ms,
+                           tolerance_ms=1):
+    """The light comes on as a pour ends and goes off light_ms after the
+    last one."""
+    for on_at, off_at in self.intervals(light_pin):
+      assert any(abs(on_at - end) * 1000 <= tolerance_ms
+                 for end in pour_ends), (
+        'Light came on at %.3f without a pour ending' % on_at)
+      if off_at is not None:
+        last_end = max(end for end in pour_ends if end <= off_at)
+        ms = (off_at - last_end) * 1000
+        assert abs(ms - light_ms) <= tolerance_ms, (
+          'Light went off %d ms after the last pour, expected %d ms' % (
+            ms, light_ms))
+
+  def report(self, names=None):
+    names = names or {}
+    lines = []
+    for number in sorted(self.pins):
+      intervals = [(on, off) for on, off in self.intervals(number)
+                   if off is not None]
+      total = sum(off - on for on, off in intervals)
+      lines.append('pin %2s %-12s %4s times on, %8.1f s on in total' % (
+        number, names.get(number, ''), len(intervals), total))
+    return '\n'.join(lines)
+
+def simulate(hours, drinks_per_hour, max_switches, seed, calibration=None):
+  # Imported here so the pins above can be used without pygame.
+  from robot import Robot
+  import values
+
+  random.seed(seed)
+  clock = VirtualClock(start=time.time())
+  board = SimBoard(now=clock.time)
+  robot = Robot(led=board.LED, max_switches=max_switches,
+                set_timer=clock.set_timer, now=clock.time,
+                calibration=calibration)
+  waits = []
+  pour_ends = []
+  def record_pour(what, pour):
+    if what == 'start':
+      waits.append(pour.started_at - pour.requested_at)
+    else:
+      pour_ends.append(pour.finished_at)
+  robot.add_listener(record_pour)
+
+  # Drinks are asked for at random, at the given rate on average.
+  end_ms = hours * 3600 * 1000
+  at_ms = 0
+  started = time.perf_counter()
+  while True:
+    at_ms += random.expovariate(drinks_per_hour / 3600000)
+    if at_ms > end_ms:
+      break
+    clock.run(robot.handle_event_type, until_ms=at_ms)
+    robot.pour_drink(random.randrange(len(robot.tier_to_switch)))
+  clock.run(robot.handle_event_type)
+  took = time.perf_counter() - started
+
+  pour_pins = [s.number for switches in robot.tier_to_switch.values()
+               for s in switches]
+  names = {robot.light_switch.number: 'light'}
+  for tier, switches in robot.tier_to_switch.items():
+    for switch, ms in zip(switches, robot.line_times_ms(tier)):
+      names[switch.number] = 'tier %s' % tier
+      board.assert_durations([switch.number], ms)
+  board.assert_max_on(max_switches, pour_pins)
+  board.assert_light_follows(robot.light_switch.number, pour_ends,
+                             values.LIGHT_TIME_MS)
+
+  print(board.report(names))
+  print('%s drinks in %s simulated hours in %.2f s' % (
+    len(waits), hours, took))
+  if waits:
+    waits.sort()
+    print('Waited for a tier: median %.0f s, max %.0f s' % (
+      waits[len(waits) // 2], waits[-1]))
+  print('At most %s pour switches on at once (limit %s)' % (
+    board.max_on(pour_pins), max_switches))
+
+if __name__ == '__main__':
+  import values
+  parser = argparse.ArgumentParser(
+    description='Simulate a night of pours on simulated GPIO pins.')
+  parser.add_argument('--hours', type=float, default=6)
+  parser.add_argument('--drinks-per-hour', type=float, default=40)
+  parser.add_argument('--max-switches', type=int,
+                      default=values.MAX_CONCURRENT_SWITCHES)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--ml-per-sec', type=float, metavar='RATE',
+                      help='pretend every line was calibrated at RATE '
+                           '(default: use %s)' % values.CALIBRATION_PATH)
+  args = parser.parse_args()
+  calibration = None
+  if args.ml_per_sec:
+    calibration = dict((str(pin), args.ml_per_sec)
+                       for pins in values.TIER_TO_PINS.values()
+                       for pin in pins)
+  simulate(args.hours, args.drinks_per_hour, args.max_switches, args.seed,
+           calibration)
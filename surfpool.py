@@ -0,0 +1,62 @@
+import pygame
+
+from textcache import surface_bytes
+
+class SurfacePool(object):
+  """Lends out the surfaces that displays make over and over again.
+
+  A display borrows its surfaces while it is set up, and they all come back
+  to the pool with release() when the game moves on from it, ready for the
+  next display that wants the same size. Surfaces are keyed by size, flags
+  and depth. A borrowed surface still has whatever was last drawn on it,
+  so it must be painted over completely before it is shown.
+  """
+  def __init__(self):
+    self.free = {}
+    # id(owner) -> (owner, [(key, surface)]).
+    self.lent = {}
+    self.allocated = 0
+    self.reused = 0
+    # Everything the pool ever made, and what of it sits waiting in the
+    # pool, now and at most.
+    self.bytes = 0
+    self.pooled_bytes = 0
+    self.peak_pooled_bytes = 0
+
+  def borrow(self, owner, size, flags=0, depth=0):
+    key = (tuple(size), flags, depth)
+    free = self.free.get(key)
+    if free:
+      surface = free.pop()
+      self.reused += 1
+      self.pooled_bytes -= surface_bytes(surface)
+    else:
+      if depth:
+        surface = pygame.Surface(size, flags, depth)
+      else:
+        # The display's own format.
+        surface = pygame.Surface(size, flags)
+      self.allocated += 1
+      self.bytes += surface_bytes(surface)
+    self.lent.setdefault(id(owner), (owner, []))[1].append((key, surface))
+    return surface
+
+  def release(self, owner):
+    """Takes back every surface owner borrowed."""
+    _, surfaces = self.lent.pop(id(owner), (None, []))
+    for key, surface in surfaces:
+      self.free.setdefault(key, []).append(surface)
+      self.pooled_bytes += surface_bytes(surface)
+    self.peak_pooled_bytes = max(self.peak_pooled_bytes, self.pooled_bytes)
+
+  def stats(self):
+    return {
+      'allocated': self.allocated,
+      'reused': self.reused,
+      'lent': sum(len(surfaces) for _, surfaces in self.lent.values()),
+      'bytes': self.bytes,
+      'pooled_bytes': self.pooled_bytes,
+      'peak_pooled_bytes': self.peak_pooled_bytes,
+    }
+
+surface_pool = SurfacePool()
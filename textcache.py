@@ -0,0 +1,88 @@
+from collections import OrderedDict
+
+import pygame
+
+class TextCache(object):
+  """An LRU cache of rendered text surfaces shared by every display.
+
+  Surfaces are keyed by (font, size, text, color, antialias) and converted to
+  the display format once, so drawing the same string again is a plain blit.
+  The cache is bounded by the total number of bytes of pixel data it holds.
+  Cached surfaces are shared, so callers must only ever blit them.
+  """
+  def __init__(self, max_bytes=32 * 1024 * 1024):
+    self.max_bytes = max_bytes
+    self.surfaces = OrderedDict()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def render(self, font, text, antialias, color):
+    key = (font.name, font.point_size, text, tuple(pygame.Color(color)),
+           bool(antialias))
+    s = self.surfaces.get(key)
+    if s is not None:
+      self.hits += 1
+      self.surfaces.move_to_end(key)
+      return s
+
+    self.misses += 1
+    s = font.font.render(text, antialias, color)
+    if pygame.display.get_surface():
+      s = s.convert_alpha()
+    self.surfaces[key] = s
+    self.bytes += surface_bytes(s)
+    while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+      _, evicted = self.surfaces.popitem(last=False)
+      self.bytes -= surface_bytes(evicted)
+      self.evictions += 1
+    return s
+
+  def clear(self):
+    self.surfaces.clear()
+    self.bytes = 0
+
+  def stats(self):
+    return {
+      'entries': len(self.surfaces),
+      'bytes': self.bytes,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+    }
+
+class CachedFont(object):
+  """A pygame font whose render() goes through a TextCache.
+
+  With a Resources registry the font file is only opened when first used.
+  """
+  def __init__(self, name, size, cache, resources=None, priority=50):
+    self.name = name
+    self.point_size = size
+    self.cache = cache
+    self.resources = resources
+    self.key = 'font %s %s' % (name, size)
+    self._font = None
+    if resources is None:
+      self._font = pygame.font.Font(name, size)
+    else:
+      resources.register(self.key, lambda: pygame.font.Font(name, size),
+                         priority)
+
+  @property
+  def font(self):
+    if self._font is None:
+      self._font = self.resources.get(self.key)
+    return self._font
+
+  def render(self, text, antialias, color):
+    return self.cache.render(self, text, antialias, color)
+
+  def __getattr__(self, attr):
+    return getattr(self.font, attr)
+
+def surface_bytes(s):
+  return s.get_pitch() * s.get_height()
+
+text_cache = TextCache()
@@ -1,13 +1,101 @@
 import json
+import os
 
 # Should be 60
 GAME_DURATION_SECS = 60
 # Should be True
 USE_MUSIC = True
-# Should be 120 * 1000
+# Mixer buffer in samples: smaller means less delay between a hit and its
+# sound, too small and the audio crackles. Find the smallest one that works
+# on the cabinet with latency_probe.py.
+MIXER_BUFFER = 1024
+# How many beats long each music loop is, for switching tracks on the beat.
+MUSIC_BEATS_PER_LOOP = 32
+# Switch to the hurry track on the next bar, with no gap or fade.
+MUSIC_SWITCH_BEATS = 4
+MUSIC_CROSSFADE_MS = 0
+# The game logic moves on in steps of FIXED_STEP_MS whatever the frame rate,
+# so the round, blinking and animations take the same time at any fps. None
+# moves it on by the time each frame took instead.
+FIXED_STEP_MS = 10
+# Frames drawn per second at most, 0 for as many as the Pi can manage.
+MAX_FPS = 30
+# In the attract loop, sleep until the screen is next due to change or a key
+# is pressed instead of drawing every frame.
+IDLE_SLEEP = True
+# Should be 120 * 1000; how long a drink pours for when its lines have not
+# been calibrated.
 BASE_POUR_TIME_MS = 120 * 1000
+# Measured flow rate of each line, written by calibrate.py.
+CALIBRATION_PATH = 'calibration.json'
+
+def load_calibration(key='ml_per_sec', path=CALIBRATION_PATH):
+  """Per line measurements from calibrate.py, keyed by pin number.
+
+  'ml_per_sec' is each line's flow rate, 'prime_ml' how much it takes to
+  fill it. Without them every pour takes BASE_POUR_TIME_MS.
+  """
+  if not os.path.isfile(path):
+    return {}
+  with open(path) as f:
+    return json.load(f).get(key, {})
+
+# The GPIO pins of the switches for each tier's lines, and of the light.
+TIER_TO_PINS = {
+  0: (0, 5),
+  1: (6, 13),
+  2: (19,),
+}
+LIGHT_PIN = 26
+# How many pour switches the power supply can drive at once; tiers pour
+# together while they fit.
+MAX_CONCURRENT_SWITCHES = 4
+# Off the Pi, drive the real robot on simulated GPIO pins (see simgpio.py)
+# instead of the one that only prints. Should be False
+USE_SIMULATED_GPIO = False
+# Should be True: queue each player's drink and go straight on to the next
+# player, with the pours shown in a ticker. False makes the next player wait
+# on the Please Wait screen while the drink's tier is busy.
+NONBLOCKING_POURS = True
+# How long a finished drink stays on the ticker.
+POUR_TICKER_DONE_SECS = 20
 # Should be 10 * 1000
 LIGHT_TIME_MS = 10 * 1000
+# Only redraw and push the parts of the screen that changed instead of the
+# whole screen every frame. Needs SCREEN_SCALING = 'software': SDL's renderer
+# always presents whole frames, so with 'sdl' this does nothing.
+USE_DIRTY_RECTS = False
+# How the 1024x600 screen is scaled to the panel: 'sdl' with SDL's renderer
+# on the GPU, or 'software' with pygame.transform (see scaling.py). Should be
+# 'sdl'
+SCREEN_SCALING = 'sdl'
+# Smooth scaling to fill as much of the panel as possible, rather than sharp
+# pixels scaled by a whole factor where the panel is large enough.
+SCREEN_SCALE_SMOOTH = False
+# How many scaled static frames to keep when scaling in software.
+SCREEN_CACHE_FRAMES = 50
+# CRT look: a scanline every CRT_SCANLINE_SPACING rows that keeps
+# CRT_SCANLINE_LEVEL of the brightness, the whole picture dimmed to CRT_DIM
+# and an additive glow of strength CRT_BLOOM (expensive on the Pi).
+CRT_SCANLINE_SPACING = 5
+CRT_SCANLINE_LEVEL = 0.0
+CRT_DIM = 1.0
+CRT_BLOOM = 0.0
+# How many processed static frames (e.g. the title animation) to keep when
+# bloom is on.
+CRT_CACHE_FRAMES = 50
+# Where high scores are kept: 'json' for scores.json, 'sqlite' for scores.db
+# (import old scores with import_scores.py).
+SCORE_BACKEND = 'json'
+# Fonts and sounds not needed yet are loaded in the idle time between
+# frames, spending up to PREFETCH_BUDGET_MS of a frame on them.
+PREFETCH_BUDGET_MS = 5
+# Frame timings: rolling p50/p95/max over the last PERF_WINDOW_FRAMES frames,
+# appended to PERF_DUMP_PATH every PERF_DUMP_SECS (None to not write them).
+# F3 shows them on screen.
+PERF_WINDOW_FRAMES = 300
+PERF_DUMP_PATH = 'perf.jsonl'
+PERF_DUMP_SECS = 60
 
 scoremap = json.load(open('scoremap.json'))
 rewardmap = json.load(open('rewardmap.json'))
@@ -15,3 +103,13 @@ drinks = rewardmap['drinks']
 tiers = rewardmap['tiers']
 assert len(drinks) == len(tiers), ('Tiers and drinks do not match, check '
                                    'rewardmap.json')
+
+# How many ml each line of a tier pours for its drink.
+recipes = rewardmap.get('recipes')
+if recipes:
+  assert [len(r) for r in recipes] == [
+    len(TIER_TO_PINS[t]) for t in range(len(drinks))], (
+      'Recipes and lines do not match, check rewardmap.json')
+  # A line with nothing to pour would never get a timer to turn it off.
+  assert all(ml > 0 for r in recipes for ml in r), (
+    'Every line of a recipe must pour some ml, check rewardmap.json')